@@ -1,16 +1,35 @@
-from copy import deepcopy
 # import random
+import atexit
+import multiprocessing
+import queue
 import time
+import unittest
 from typing import Tuple, Union
 
-from util import get_other_player, log
+from util import get_candidate_squares, get_other_player, log
 from board import Board
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+from move_ordering import MoveOrderer
+from threat_search import find_forced_win
+from evaluation import evaluate_windows
+from opening_book import get_book_move
+from endgame import get_endgame_move
+from search_stats import SearchStats, SEARCH, BOOK, FORCED, ENDGAME
+
+import cfg
 
 ab_time_filename = 'abTime.txt'
 INF = float('inf')
 # PRIORITY = False
 PRIORITY = True
 MAX_DEPTH = 6
+USE_TRANSPOSITION_TABLE = True
+USE_MOVE_ORDERING = True    # killer/history move ordering (False: PRIORITY neighbor count ordering)
+TIME_BUDGET = None      # seconds per ab_bot move; if this or NODE_BUDGET is set ab_bot deepens iteratively
+NODE_BUDGET = None      # nodes per ab_bot move (None: no limit)
+WIN_SCORE = 1000        # negamax scores are integers so null windows (alpha, alpha + 1) are exact
+ASPIRATION_WINDOW = 250  # half width of the negamax root window around the previous iteration's score
+EVALUATOR = evaluate_windows    # static evaluation of depth limited leaves, in (-1, 1) (None: score them as draws)
 M = 3
 N = 3
 K = 3
@@ -33,49 +52,254 @@ def reward_for_first_player(first_player, winner):
             return -1
 
 
+def leaf_value(board: Board, player: int):
+    """
+    Value of a position the search stops at without the game being over
+    :param board:
+    :param player: player the value is for
+    :return: EVALUATOR value, strictly between a loss (-1) and a win (1)
+    """
+    if EVALUATOR is None:
+        return 0
+    return EVALUATOR(board, player)
+
+
 def is_terminal(board: Board, move: int, player: int, depth: int):
     if move is None:
         return False  # start of the game is False
     return board.is_gameover(move, player) or depth == 0
 
 
-THRESHOLD_PRINT = 10000
+BUDGET_CHECK_INTERVAL = 256  # nodes between wall clock checks
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when the time or node budget of iterative_deepening runs out
+    """
+    pass
+
+
+search_deadline = None  # wall clock time the current search must stop at (None: no limit)
+search_node_limit = None  # cnt_node value the current search must stop at (None: no limit)
+pv_move = None  # best root move of the previous iteration, searched first
+
+
+def check_budget():
+    # called for every node; the clock is only read every BUDGET_CHECK_INTERVAL nodes
+    if search_node_limit is not None and cnt_node > search_node_limit:
+        raise SearchTimeout()
+    if search_deadline is not None and cnt_node % BUDGET_CHECK_INTERVAL == 0 and time.time() > search_deadline:
+        raise SearchTimeout()
+
+transposition_table = None  # type: Union[None, TranspositionTable]   # created by ab_bot, kept between moves
+
+
+def probe_table(board: Board, depth: int, alpha, beta, player: int, first_player: int):
+    """
+    Look the position up in the transposition table
+    Values in the table are for the player to move; here they are converted to first player values
+    :return: (value if the entry settles this node else None, narrowed alpha, narrowed beta, stored best move)
+    """
+    if transposition_table is None:
+        return None, alpha, beta, None
+    entry = transposition_table.lookup(board, player)
+    if entry is None:
+        return None, alpha, beta, None
+
+    value, flag = entry.value, entry.flag
+    if player != first_player:  # negate, which also swaps lower and upper bounds
+        value = -value
+        flag = {EXACT: EXACT, LOWER: UPPER, UPPER: LOWER}[flag]
+    if entry.depth >= depth:
+        if flag == EXACT:
+            return value, alpha, beta, entry.move
+        elif flag == LOWER:
+            alpha = max(alpha, value)
+        else:
+            beta = min(beta, value)
+        if alpha >= beta:
+            return value, alpha, beta, entry.move
+    return None, alpha, beta, entry.move
+
+
+def save_to_table(board: Board, depth: int, alpha, beta, player: int, first_player: int, v, v_move):
+    """
+    Store a node result in the transposition table
+    alpha and beta are the window the node was called with; v is the first player value found
+    """
+    if transposition_table is None or v_move is None:
+        return
+    if v <= alpha:
+        flag = UPPER
+    elif v >= beta:
+        flag = LOWER
+    else:
+        flag = EXACT
+    if player != first_player:
+        v = -v
+        flag = {EXACT: EXACT, LOWER: UPPER, UPPER: LOWER}[flag]
+    transposition_table.save(board, player, v, flag, depth, v_move)
+
+
+def order_moves(candidates, first_move):
+    # search the transposition table's best move first
+    if first_move is None or first_move not in candidates:
+        return candidates
+    return [first_move] + [move for move in candidates if move != first_move]
+
+
+move_orderer = None  # type: Union[None, MoveOrderer]   # created by the bots, kept between moves
+
+
+def init_move_orderer(board: Board):
+    # (re)create the move orderer for the board and age the history of the previous search
+    global move_orderer
+    if not USE_MOVE_ORDERING:
+        move_orderer = None
+    elif move_orderer is None or not move_orderer.fits(board):
+        move_orderer = MoveOrderer(board.size, board.k)
+    else:
+        move_orderer.age()
+
+
+def get_ordered_moves(board: Board, player: int, table_move, root: bool = False):
+    """
+    Moves of a node in search order
+    :param board:
+    :param player: player to move
+    :param table_move: best move from the transposition table (or None)
+    :param root: True at the root: symmetric duplicates are dropped and the previous iteration's move goes first
+    :return:
+    """
+    if move_orderer is not None and move_orderer.fits(board):
+        candidates = move_orderer.order(board, player, table_move, get_candidate_squares(board))
+    else:
+        candidates = order_moves(get_candidate_moves(board, PRIORITY), table_move)
+    if root:
+        candidates = order_moves(get_distinct_moves(board, candidates), pv_move)
+    return candidates
+
+
+def record_cutoff(board: Board, player: int, move: int, depth: int, first: bool):
+    # an orderer made for another board (no init_move_orderer before this search) is left alone
+    if move_orderer is not None and move_orderer.fits(board):
+        move_orderer.record_cutoff(board, player, move, depth, first)
+    if search_stats is not None:
+        search_stats.add_cutoff(root_empty_count - board.get_empty_count(), first)
+
+
+search_stats = None  # type: Union[None, SearchStats]   # stats of the running ab_search/negamax_search
+last_stats = None  # type: Union[None, SearchStats]     # stats of the last finished search
+root_empty_count = 0  # empty squares at the root of the running search (ply = root_empty_count - empty squares)
+search_start = 0.   # wall clock time the running search started
+
+
+def record_leaf(board: Board):
+    # track the deepest ply the search reached
+    if search_stats is not None:
+        ply = root_empty_count - board.get_empty_count()
+        if ply > search_stats.max_ply:
+            search_stats.max_ply = ply
+
+
+def start_stats(board: Board, algorithm: str):
+    """
+    Start collecting stats for a search from board
+    :return: SearchStats of the search
+    """
+    global search_stats, root_empty_count, search_start, cnt_node
+    cnt_node = 0
+    root_empty_count = board.get_empty_count()
+    search_start = time.time()
+    search_stats = SearchStats(algorithm)
+    search_stats.searches = 1
+    return search_stats
+
+
+def finish_stats(stats: SearchStats, source: str, depth: int = 0, table=None, probes: int = 0, hits: int = 0):
+    """
+    :param stats: from start_stats
+    :param source: SEARCH, BOOK, FORCED or ENDGAME
+    :param depth: completed search depth
+    :param table: transposition table used by the search (or None)
+    :param probes: table.probes when the search started
+    :param hits: table.hits when the search started
+    :return: stats
+    """
+    global search_stats, last_stats
+    stats.elapsed = time.time() - search_start
+    stats.sources[source] += 1
+    stats.nodes = cnt_node
+    stats.completed_depth = depth
+    if table is not None:
+        stats.table_probes = table.probes - probes
+        stats.table_hits = table.hits - hits
+    log(f'{stats}')
+    search_stats, last_stats = None, stats
+    return stats
+
+
+def get_quick_move(board: Board, player: int):
+    """
+    Move that needs no alpha-beta search: from the opening book, the endgame solver or a forced win of the
+    threat search
+    :return: move (or None) and its source
+    """
+    book_move = get_book_move(board, player)
+    if book_move is not None:
+        return book_move, BOOK
+    endgame_move = get_endgame_move(board, player)
+    if endgame_move is not None:
+        return endgame_move, ENDGAME
+    forced = find_forced_win(board, player)     # narrow search of forcing lines first
+    if forced is not None:
+        return forced, FORCED
+    return None, SEARCH
 
 
 def min_value(board: Board, depth: int, alpha: int, beta: int,
               player: int, first_player: int, previous_move: int) -> Tuple[int, Union[None, int]]:
     global cnt_node
     cnt_node += 1
-    # if cnt_node % THRESHOLD_PRINT == 0:
-    #     print(f'{cnt_node=}')
+    check_budget()
 
     previous_player = get_other_player(player)
     terminal = is_terminal(board, previous_move, previous_player, depth)
     if terminal:
         # log(f'is_terminal for player {previous_player}')
         # board.show()
+        record_leaf(board)
+        if not board.gameover:  # depth limit
+            return leaf_value(board, first_player), None
         return reward_for_first_player(first_player, board.winner), None
 
+    alpha_orig, beta_orig = alpha, beta
+    value, alpha, beta, table_move = probe_table(board, depth, alpha, beta, player, first_player)
+    if value is not None:
+        return value, table_move
+
     v = INF
     v_move = None
     # log(f'parent MAX, {terminal=}, {previous_move=}, {previous_player=}, {player=}')
     # board.show()
 
     # for move in board.get_empty_squares():
-    for move in get_candidate_moves(board, PRIORITY):
-        boardCopy = deepcopy(board)  # type: Board
-        boardCopy.make_move(move, player)
-
-        v_child, _ = max_value(boardCopy, depth - 1, alpha, beta,
+    for i, move in enumerate(get_ordered_moves(board, player, table_move)):
+        board.push(move, player)  # search in place, undone with pop below
+        v_child, _ = max_value(board, depth - 1, alpha, beta,
                                get_other_player(player), first_player, move)
-        # boardCopy.show()
+        board.pop()
+        # board.show()
         # log(f'{move=}, {v_child=}, {alpha=}, {beta=}')
 
         if v_child < v:
             v, v_move = v_child, move
             beta = min(beta, v)
         if v <= alpha:
-            return v, v_move
+            record_cutoff(board, player, move, depth, i == 0)
+            break
+    save_to_table(board, depth, alpha_orig, beta_orig, player, first_player, v, v_move)
     return v, v_move
 
 
@@ -94,38 +318,61 @@ def get_candidate_moves(board: Board, priority=False):
         #     res.append(selected_square)
     else:
         res = board.get_empty_squares()
+    nearby = get_candidate_squares(board)     # proximity pruning on large boards
+    if len(nearby) < len(res):
+        nearby = set(nearby)
+        res = [pos for pos in res if pos in nearby]
     assert isinstance(res, list)
     return res
 
 
+def get_distinct_moves(board: Board, candidates):
+    """
+    Drop candidates that are symmetric duplicates of an earlier candidate (same search result)
+    Only worth doing at the root, where near-empty boards have many symmetries
+    :param board:
+    :param candidates:
+    :return: candidates in the same order, one per group of symmetric moves
+    """
+    distinct = set(board.get_symmetry_distinct_moves())
+    return [move for move in candidates if move in distinct]
+
+
 def max_value(board: Board, depth, alpha, beta, player, first_player, previous_move=None) -> Tuple[
     int, Union[int, None]]:
     global cnt_node
     cnt_node += 1
-    if cnt_node % THRESHOLD_PRINT == 0:
-        print(f'{cnt_node=}')
+    check_budget()
 
     previous_player = get_other_player(player)
     terminal = is_terminal(board, previous_move, previous_player, depth)
     if terminal:
         # log(f'is_terminal for player {previous_player}')
         # board.show()
+        record_leaf(board)
+        if not board.gameover:  # depth limit
+            return leaf_value(board, first_player), None
         return reward_for_first_player(first_player, board.winner), None
 
     # log('parent MAX')
     # log(f'parent MAX, {terminal=}, {previous_move=}, {previous_player=}, {player=}')
     # board.show()
 
+    alpha_orig, beta_orig = alpha, beta
+    value, alpha, beta, table_move = probe_table(board, depth, alpha, beta, player, first_player)
+    if previous_move is None:  # the root always searches its full window so it has a move to return
+        alpha, beta = alpha_orig, beta_orig
+    elif value is not None:
+        return value, table_move
+
     v = -INF
     v_move = None
-    candidates = get_candidate_moves(board, PRIORITY)
-    for move in candidates:
-        boardCopy = deepcopy(board)  # type: Board
-        boardCopy.make_move(move, player)
-
-        v_child, _ = min_value(boardCopy, depth - 1, alpha, beta,
+    for i, move in enumerate(get_ordered_moves(board, player, table_move, previous_move is None)):
+        board.push(move, player)  # search in place, undone with pop below
+        v_child, _ = min_value(board, depth - 1, alpha, beta,
                                get_other_player(player), first_player, move)
-        # boardCopy.show()
+        board.pop()
+        # board.show()
         # log(f'{move=}, {v_child=}, {alpha=}, {beta=}')
 
         if v_child > v:
@@ -133,33 +380,393 @@ def max_value(board: Board, depth, alpha, beta, player, first_player, previous_m
             alpha = max(alpha, v)
 
         if v >= beta:
-            return v, v_move
+            record_cutoff(board, player, move, depth, i == 0)
+            break
 
+    save_to_table(board, depth, alpha_orig, beta_orig, player, first_player, v, v_move)
     return v, v_move
 
 
+def minimax_root(board: Board, player: int, depth: int, previous_value):
+    # one iterative deepening iteration of the max_value/min_value search
+    return max_value(board, depth, -2, 2, player, player, None)
+
+
+pool = None  # worker processes of the parallel root search, created on first use and kept between moves
+pool_workers = 0
+
+# settings the search reads: workers get their values with every task, their own copies are from when the pool
+# was started
+SEARCH_SETTINGS = ['PRIORITY', 'USE_TRANSPOSITION_TABLE', 'USE_MOVE_ORDERING', 'EVALUATOR']
+SEARCH_CFG = ['candidate_radius', 'candidate_min_cells', 'tt_size', 'tt_replacement']
+
+
+def get_search_settings():
+    # current values of SEARCH_SETTINGS (this module) and SEARCH_CFG (cfg)
+    return ({name: globals()[name] for name in SEARCH_SETTINGS},
+            {name: getattr(cfg, name) for name in SEARCH_CFG})
+
+
+def set_search_settings(settings):
+    # set the values from get_search_settings (in a worker process)
+    module_settings, cfg_settings = settings
+    globals().update(module_settings)
+    for name, value in cfg_settings.items():
+        setattr(cfg, name, value)
+
+
+def get_pool(workers: int):
+    global pool, pool_workers
+    if pool is None or pool_workers != workers:
+        close_pool()
+        pool = multiprocessing.Pool(workers)
+        pool_workers = workers
+    return pool
+
+
+def close_pool():
+    global pool, pool_workers
+    if pool is not None:
+        pool.terminate()
+        pool.join()
+    pool, pool_workers = None, 0
+
+
+atexit.register(close_pool)
+
+
+worker_search = None    # (in a worker process) root search its transposition table and move orderer belong to
+root_searches = 0       # parallel root searches started by this process, tells workers when a new one starts
+
+
+def search_root_move(args):
+    """
+    Worker task of parallel_root_search: search one root move with the alpha bound of the moves before it
+    A worker keeps its transposition table and move orderer for all the moves of one root search it gets and
+    starts new ones with the next root search. Every position has the same remaining depth wherever it is
+    reached in one root search, so what the table holds does not change the values that beat alpha
+    :param args: search id, board (root position), player, move, depth, alpha, deadline (or None),
+    get_search_settings()
+    :return: first player value of the move (None if the deadline passed) and nodes searched
+    """
+    search_id, board, player, move, depth, alpha, deadline, settings = args
+    global cnt_node, transposition_table, move_orderer, search_deadline, search_stats, worker_search
+    set_search_settings(settings)
+    if search_id != worker_search:
+        worker_search = search_id
+        transposition_table = TranspositionTable() if USE_TRANSPOSITION_TABLE else None
+        move_orderer = MoveOrderer(board.size, board.k) if USE_MOVE_ORDERING else None
+    cnt_node = 0
+    search_stats = None     # inherited from the parent process, which counts the nodes itself
+    search_deadline = deadline
+    board.push(move, player)
+    try:
+        v, _ = min_value(board, depth - 1, alpha, 2, get_other_player(player), player, move)
+    except SearchTimeout:
+        return None, cnt_node
+    finally:
+        board.pop()
+    return v, cnt_node
+
+
+def parallel_root_search(board: Board, player: int, depth: int, workers: int = None):
+    """
+    Young brothers wait style root split: the first (best ordered) root move is searched here to get an alpha
+    bound, then the remaining moves are searched in worker processes. Each move is handed out as soon as a
+    worker is free, with the best value found so far among the moves before it as alpha (as max_value would
+    have when it gets to the move). A move that beats its alpha gets its exact value, and the earliest move
+    with the best value is always one of those, so the result is the move and value of max_value whatever the
+    number of workers or the order they finish in
+    Deadlines (search_deadline) apply to the workers too; node budgets only count the first move
+    :param board:
+    :param player:
+    :param depth:
+    :param workers: number of processes (default: cfg.ab_workers)
+    :return: value and best move
+    """
+    global cnt_node, root_searches
+    workers = cfg.ab_workers if workers is None else workers
+    table_move = probe_table(board, depth, -2, 2, player, player)[3]    # same root order as max_value
+    moves = get_ordered_moves(board, player, table_move, root=True)
+    cnt_node += 1
+    first = moves[0]
+    board.push(first, player)
+    try:
+        v, _ = min_value(board, depth - 1, -2, 2, get_other_player(player), player, first)
+    finally:
+        board.pop()
+    if v == 1 or len(moves) == 1:
+        return v, first
+
+    root_searches += 1
+    settings = get_search_settings()
+    pool = get_pool(workers)
+    done = queue.Queue()
+    values = [v] + [None] * (len(moves) - 1)
+
+    def submit(i):
+        # alpha: best value of the moves before i that are done (a lower bound of max_value's alpha at move i)
+        alpha = max(value for value in values[:i] if value is not None)
+        task = (root_searches, board, player, moves[i], depth, alpha, search_deadline, settings)
+        pool.apply_async(search_root_move, (task,), callback=lambda result: done.put((i, result)),
+                         error_callback=lambda error: done.put((i, error)))
+
+    next_move, running = 1, 0
+    failure = None      # SearchTimeout, or the exception a worker raised
+    while next_move < len(moves) or running:
+        while failure is None and running < workers and next_move < len(moves):
+            submit(next_move)
+            next_move += 1
+            running += 1
+        if not running:
+            break
+        i, result = done.get()
+        running -= 1
+        if isinstance(result, BaseException):
+            failure = result
+            continue
+        v_child, nodes = result
+        cnt_node += nodes
+        if v_child is None:
+            failure = SearchTimeout()
+        values[i] = v_child
+    if failure is not None:     # raised once no task of this search is left running
+        raise failure
+
+    v_move = first
+    for move, v_child in zip(moves[1:], values[1:]):
+        if v_child > v:
+            v, v_move = v_child, move
+    save_to_table(board, depth, -2, 2, player, player, v, v_move)
+    return v, v_move
+
+
+def parallel_root(board: Board, player: int, depth: int, previous_value):
+    # one iterative deepening iteration of parallel_root_search
+    return parallel_root_search(board, player, depth)
+
+
+def iterative_deepening(board: Board, player: int, max_depth: int, time_budget=None, node_budget=None,
+                        root_search=minimax_root, win_value=1):
+    """
+    Search to depth 1, 2, 3, ... max_depth until the time or node budget runs out
+    Each iteration searches the previous iteration's best move first (deeper nodes get their previous best move
+    from the transposition table). Depth 1 always completes so there is always a move to return
+    :param board:
+    :param player:
+    :param max_depth:
+    :param time_budget: seconds (None: no limit)
+    :param node_budget: nodes, counted over all iterations (None: no limit)
+    :param root_search: function(board, player, depth, previous iteration value) -> (value, move)
+    :param win_value: value of a proven win for root_search (deepening stops once it is reached)
+    :return: value and best move of the deepest completed iteration, and that depth
+    """
+    global search_deadline, search_node_limit, pv_move
+    start = time.time()
+    start_nodes = cnt_node
+    root_depth = len(board.history)
+    val, move, completed = None, None, 0
+    pv_move = None
+    try:
+        for depth in range(1, max_depth + 1):
+            if depth > 1:  # depth 1 runs without limits
+                search_deadline = start + time_budget if time_budget is not None else None
+                search_node_limit = start_nodes + node_budget if node_budget is not None else None
+            try:
+                val, move = root_search(board, player, depth, val)
+            except SearchTimeout:
+                board.pop_to(root_depth)    # unwind the moves of the interrupted iteration
+                break
+            completed = depth
+            pv_move = move
+            log(f'Depth {depth}: {move=}, {val=}, {cnt_node=}')
+            # a win or loss is proven, and a search as deep as the empty squares has seen every game end
+            if abs(val) >= win_value or depth >= board.get_empty_count():
+                break
+    finally:
+        search_deadline, search_node_limit, pv_move = None, None, None
+    return val, move, completed
+
+
 def ab_bot(board: Board, player: int):
+    return ab_search(board, player)[0]
+
+
+def ab_search(board: Board, player: int):
+    """
+    Alpha-beta move search of ab_bot, also returning the stats of the search
+    Nodes of parallel workers are counted, their cutoffs and table hits are not
+    :param board:
+    :param player:
+    :return: move and SearchStats
+    """
     # TODO: change max depth
     if MAX_DEPTH is not None:
         max_depth = MAX_DEPTH
     else:
         max_depth = board.size[0] * board.size[1]
+    global transposition_table
+    stats = start_stats(board, 'ab')
+    move, source = get_quick_move(board, player)
+    if move is not None:
+        return move, finish_stats(stats, source)
+    if USE_TRANSPOSITION_TABLE and transposition_table is None:
+        transposition_table = TranspositionTable()
+    elif not USE_TRANSPOSITION_TABLE:
+        transposition_table = None
+    table = transposition_table
+    probes, hits = (table.probes, table.hits) if table is not None else (0, 0)
+    init_move_orderer(board)
+    parallel = cfg.ab_workers > 1
+    depth = max_depth
+    if TIME_BUDGET is not None or NODE_BUDGET is not None:
+        val, move, depth = iterative_deepening(board, player, max_depth, TIME_BUDGET, NODE_BUDGET,
+                                               parallel_root if parallel else minimax_root)
+    elif parallel:
+        val, move = parallel_root_search(board, player, max_depth)
+    else:
+        val, move = max_value(board, max_depth, -2, 2, player, player, None)
+    return move, finish_stats(stats, SEARCH, depth, table, probes, hits)
+
+
+negamax_table = None  # type: Union[None, TranspositionTable]   # negamax scores use their own scale and table
+
+
+def negamax(board: Board, depth: int, alpha: int, beta: int, player: int, previous_move=None) -> Tuple[
+        int, Union[int, None]]:
+    """
+    Negamax alpha-beta with principal variation search: the first (best ordered) child is searched with the
+    full window, the others with a null window (alpha, alpha + 1) that only proves they are no better. A child
+    that fails high is searched again with the full window
+    :param board:
+    :param depth: remaining depth
+    :param alpha:
+    :param beta:
+    :param player: player to move
+    :param previous_move: move that led here (None at the root)
+    :return: value for player (WIN_SCORE win, 0 draw or depth limit, -WIN_SCORE loss) and best move
+    """
     global cnt_node
-    cnt_node = 0
-    val, move = max_value(board, max_depth, -2, 2, player, player, None)
-    # print(f'{val=}, {move=}, {cnt_node=}')
-    return move
+    cnt_node += 1
+    check_budget()
+
+    if previous_move is not None:
+        if board.is_win(previous_move, get_other_player(player)):
+            record_leaf(board)
+            return -WIN_SCORE, None
+        if board.get_empty_count() == 0:
+            record_leaf(board)
+            return 0, None
+    if depth == 0:
+        record_leaf(board)
+        return int(leaf_value(board, player) * (WIN_SCORE - 1)), None
+
+    alpha_orig = alpha
+    table_move = None
+    if negamax_table is not None:
+        entry = negamax_table.lookup(board, player)
+        if entry is not None:
+            table_move = entry.move
+            if entry.depth >= depth and previous_move is not None:
+                if entry.flag == EXACT:
+                    return entry.value, entry.move
+                elif entry.flag == LOWER:
+                    alpha = max(alpha, entry.value)
+                else:
+                    beta = min(beta, entry.value)
+                if alpha >= beta:
+                    return entry.value, entry.move
+
+    v, v_move = -INF, None
+    for i, move in enumerate(get_ordered_moves(board, player, table_move, previous_move is None)):
+        board.push(move, player)
+        if i == 0:
+            score = -negamax(board, depth - 1, -beta, -alpha, get_other_player(player), move)[0]
+        else:
+            score = -negamax(board, depth - 1, -alpha - 1, -alpha, get_other_player(player), move)[0]
+            if alpha < score < beta:    # better than the first child after all: get its exact value
+                score = -negamax(board, depth - 1, -beta, -score, get_other_player(player), move)[0]
+        board.pop()
+
+        if score > v:
+            v, v_move = score, move
+        alpha = max(alpha, score)
+        if alpha >= beta:
+            record_cutoff(board, player, move, depth, i == 0)
+            break
+
+    if negamax_table is not None:
+        if v <= alpha_orig:
+            flag = UPPER
+        elif v >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        negamax_table.save(board, player, v, flag, depth, v_move)
+    return v, v_move
+
+
+def negamax_root(board: Board, player: int, depth: int, previous_value):
+    """
+    One iterative deepening iteration of negamax with an aspiration window: search a narrow window around the
+    previous iteration's value first and only fall back to the full window if the value lands outside it
+    """
+    full = (-WIN_SCORE - 1, WIN_SCORE + 1)
+    if previous_value is None:
+        return negamax(board, depth, full[0], full[1], player)
+    alpha, beta = previous_value - ASPIRATION_WINDOW, previous_value + ASPIRATION_WINDOW
+    val, move = negamax(board, depth, alpha, beta, player)
+    if val <= alpha or val >= beta:
+        log(f'Aspiration window ({alpha}, {beta}) failed with {val}, searching the full window')
+        val, move = negamax(board, depth, full[0], full[1], player)
+    return val, move
+
+
+def negamax_bot(board: Board, player: int):
+    """
+    Move function (same interface as ab_bot) using iterative deepening negamax/PVS with aspiration windows
+    Searches to MAX_DEPTH (whole board if None) within TIME_BUDGET/NODE_BUDGET
+    :param board:
+    :param player:
+    :return:
+    """
+    return negamax_search(board, player)[0]
+
+
+def negamax_search(board: Board, player: int):
+    """
+    Search of negamax_bot, also returning the stats of the search
+    :param board:
+    :param player:
+    :return: move and SearchStats
+    """
+    max_depth = MAX_DEPTH if MAX_DEPTH is not None else board.size[0] * board.size[1]
+    global negamax_table
+    stats = start_stats(board, 'negamax')
+    move, source = get_quick_move(board, player)
+    if move is not None:
+        return move, finish_stats(stats, source)
+    if USE_TRANSPOSITION_TABLE and negamax_table is None:
+        negamax_table = TranspositionTable()
+    elif not USE_TRANSPOSITION_TABLE:
+        negamax_table = None
+    table = negamax_table
+    probes, hits = (table.probes, table.hits) if table is not None else (0, 0)
+    init_move_orderer(board)
+    val, move, depth = iterative_deepening(board, player, max_depth, TIME_BUDGET, NODE_BUDGET,
+                                           negamax_root, WIN_SCORE)
+    return move, finish_stats(stats, SEARCH, depth, table, probes, hits)
 
 
 def bot_move(board: Board, player, algoType):
     # save_player(player)
     # This check is only there to ensure that the correct parameter(i.e ab) is passed
-    if algoType == 'ab':
+    if algoType in ['ab', 'negamax']:
         start = time.time()
-        move = ab_bot(board, player)
+        move = ab_bot(board, player) if algoType == 'ab' else negamax_bot(board, player)
         end = time.time()
-        # Record time by creating a new file
-        with open(ab_time_filename, 'w+') as timeFile_for_ab:
+        # Record time, one line per move
+        with open(ab_time_filename, 'a') as timeFile_for_ab:
             timeFile_for_ab.write(str(end - start) + '\n')
     return move
 
@@ -173,13 +780,197 @@ cnt_node = 0
 def test():
     # b = Board((3, 3), 3)
     b = Board((M, N), K)
-    print(ab_bot(b, player=1))
-    print(f'{cnt_node=}')
+    move, stats = ab_search(b, player=1)
+    print(move)
+    print(stats)
     # depth = 4 * 4
     # val, move = max_value(b, depth, -2, 2, 1, 1, None)
     # move = bot_move(b, 1, 'ab')
     # print(val, move)
 
 
+class TestAlphaBeta(unittest.TestCase):
+    # module and cfg settings the tests change, restored after every test
+    settings = ['MAX_DEPTH', 'TIME_BUDGET', 'NODE_BUDGET', 'transposition_table', 'negamax_table', 'move_orderer']
+    cfg_settings = ['ab_workers', 'endgame_empties', 'threat_search_depth', 'opening_book_dir']
+
+    def setUp(self) -> None:
+        self.saved = get_search_settings(), {name: globals()[name] for name in self.settings}, \
+            {name: getattr(cfg, name) for name in self.cfg_settings}
+        # test the search, not the moves found without it
+        cfg.endgame_empties, cfg.threat_search_depth, cfg.opening_book_dir = 0, 0, None
+
+    def tearDown(self) -> None:
+        search_settings, module_settings, cfg_settings = self.saved
+        set_search_settings(search_settings)
+        globals().update(module_settings)
+        for name, value in cfg_settings.items():
+            setattr(cfg, name, value)
+
+    @staticmethod
+    def get_board():
+        # 7x7 k=5 position a few moves in, too big to search to the end
+        board = Board((7, 7), 5)
+        for pos, player in [(24, 1), (25, 2), (18, 1), (30, 2)]:
+            board.push(pos, player)
+        return board
+
+    def test_node_budget(self):
+        global MAX_DEPTH, NODE_BUDGET
+        MAX_DEPTH = None
+        for budget in [1, 500]:
+            NODE_BUDGET = budget
+            board = self.get_board()
+            history, cells = board.history[:], bytes(board.cells)
+            move, stats = ab_search(board, 2)
+            self.assertEqual(board.history, history)    # the interrupted iteration is undone
+            self.assertEqual(bytes(board.cells), cells)
+            self.assertTrue(board.is_move_OK(move))
+            self.assertGreaterEqual(stats.completed_depth, 1)     # depth 1 always completes
+            self.assertLess(stats.completed_depth, board.get_empty_count())
+        self.assertLessEqual(stats.nodes, 500 + 1)     # stopped at the first node over the budget
+
+    def test_time_budget(self):
+        global MAX_DEPTH, TIME_BUDGET
+        MAX_DEPTH, TIME_BUDGET = None, 0.2
+        board = self.get_board()
+        start = time.time()
+        move, stats = ab_search(board, 2)
+        self.assertLess(time.time() - start, 2)
+        self.assertTrue(board.is_move_OK(move))
+        self.assertGreaterEqual(stats.completed_depth, 1)
+        self.assertEqual(len(board.history), 4)
+
+    def test_timeout_keeps_completed_iteration(self):
+        """
+        An iteration cut off by the budget is unwound and the deepest completed iteration's move is returned
+        """
+        depths = []
+
+        def root_search(board, player, depth, previous_value):
+            depths.append(depth)
+            if depth == 3:
+                board.push(0, player)
+                board.push(1, get_other_player(player))
+                raise SearchTimeout()
+            return depth / 10, 40 + depth
+
+        board = self.get_board()
+        self.assertEqual(iterative_deepening(board, 2, 10, root_search=root_search), (0.2, 42, 2))
+        self.assertEqual(depths, [1, 2, 3])
+        self.assertEqual(len(board.history), 4)
+        self.assertTrue(board.is_empty_pos(0))
+        self.assertIsNone(search_deadline)
+        self.assertIsNone(search_node_limit)
+
+    def test_parallel_matches_serial(self):
+        """
+        The parallel root search finds the value and move of max_value for any number of workers
+        """
+        import random
+        import proof_number
+        global MAX_DEPTH, transposition_table, move_orderer
+        cases = [((5, 5), 4), ((6, 6), 4)]
+        try:
+            for board, player in proof_number.get_random_positions(random.Random(531), cases, 3, (3, 6)):
+                for depth in [3, 4]:
+                    transposition_table, move_orderer = TranspositionTable(), None
+                    init_move_orderer(board)
+                    expected = max_value(board, depth, -2, 2, player, player, None)
+                    for workers in [2, 3]:
+                        transposition_table, move_orderer = TranspositionTable(), None
+                        init_move_orderer(board)
+                        self.assertEqual(parallel_root_search(board, player, depth, workers), expected)
+                        self.assertEqual(len(board.history), 0)
+
+                MAX_DEPTH = 4
+                moves = []
+                for cfg.ab_workers in [1, 2]:
+                    transposition_table, move_orderer = None, None
+                    moves.append(ab_search(board, player)[0])
+                self.assertEqual(moves[0], moves[1])
+        finally:
+            close_pool()
+
+    def test_aspiration_fallback(self):
+        """
+        A root value outside the aspiration window is searched again with the full window
+        """
+        global negamax_table
+        board = Board((4, 4), 3)
+        board.make_move(5, 1)
+        board.make_move(0, 2)       # X wins from here (two open ways to make a double threat)
+        negamax_table = TranspositionTable()
+        init_move_orderer(board)
+        value, _ = negamax(board, 5, -ASPIRATION_WINDOW, ASPIRATION_WINDOW, 1)
+        self.assertGreaterEqual(value, ASPIRATION_WINDOW)     # fails high around a previous value of 0
+        negamax_table = TranspositionTable()
+        self.assertEqual(negamax_root(board, 1, 5, 0)[0], WIN_SCORE)
+        self.assertEqual(negamax_root(board, 1, 5, None)[0], WIN_SCORE)
+        self.assertEqual(len(board.history), 0)
+
+    def test_pvs_matches_alpha_beta(self):
+        """
+        Depth limited negamax with null window probes and re-searches gets the max_value/min_value root value
+        """
+        import random
+        import proof_number
+        global negamax, negamax_table, transposition_table
+        search, re_searches = negamax, []
+        probed = set()
+
+        def counting_negamax(board, depth, alpha, beta, player, previous_move=None):
+            node = tuple(board.history)
+            if beta - alpha == 1:
+                probed.add(node)
+            elif node in probed:    # the null window probe of this node failed high
+                re_searches.append(node)
+            return search(board, depth, alpha, beta, player, previous_move)
+
+        negamax = counting_negamax
+        try:
+            cases = [((5, 5), 4), ((6, 6), 4)]
+            for board, player in proof_number.get_random_positions(random.Random(531), cases, 3, (3, 6)):
+                for depth in [2, 3, 4]:
+                    negamax_table, transposition_table = TranspositionTable(), None
+                    init_move_orderer(board)
+                    value = negamax(board, depth, -WIN_SCORE - 1, WIN_SCORE + 1, player)[0]
+                    init_move_orderer(board)
+                    ab_value = max_value(board, depth, -2, 2, player, player, None)[0]
+                    self.assertEqual(value, ab_value * WIN_SCORE if abs(ab_value) == 1 else
+                                     int(ab_value * (WIN_SCORE - 1)))
+                    self.assertEqual(len(board.history), 0)
+        finally:
+            negamax = search
+        self.assertGreater(len(re_searches), 0)
+
+    def test_engines_agree(self):
+        """
+        Full depth negamax (PVS, null windows and re-searches) and max_value/min_value play moves with the
+        value the exact endgame solver gives the position
+        """
+        import random
+        import endgame
+        import proof_number
+        global MAX_DEPTH, negamax_table, transposition_table
+        MAX_DEPTH = None
+        cases = [((3, 3), 3), ((4, 4), 3), ((3, 4), 3), ((4, 4), 4)]
+        for board, player in proof_number.get_random_positions(random.Random(531), cases, 4, (5, 8)):
+            value = endgame.solve(board, player)[0]
+            negamax_table = TranspositionTable()
+            init_move_orderer(board)
+            self.assertEqual(negamax(board, board.get_empty_count(), -WIN_SCORE, WIN_SCORE, player)[0],
+                             value * WIN_SCORE)
+            for search in [negamax_search, ab_search]:
+                negamax_table, transposition_table = None, None
+                move = search(board, player)[0]
+                board.push(move, player)
+                if not board.is_win(move, player):
+                    self.assertEqual(-endgame.solve(board, get_other_player(player))[0], value, search.__name__)
+                else:
+                    self.assertEqual(value, endgame.WIN)
+                board.pop()
+
+
 if __name__ == '__main__':
     test()
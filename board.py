@@ -2,25 +2,348 @@ from copy import deepcopy
 from typing import Tuple, Literal
 from termcolor import colored
 import numpy as np
+import itertools
+import pickle
 import random
 
 from collections import defaultdict
 from queue import PriorityQueue
 import unittest
 
+# the four line directions (row step, col step) a win can run along: right, down, down-right, down-left
+LINE_DIRECTIONS = [(0, 1), (1, 0), (1, 1), (1, -1)]
+NEIGHBOR_OFFSETS = [(-1, 0), (-1, 1), (0, 1), (1, 1),
+                    (1, 0), (1, -1), (0, -1), (-1, -1)]
+
+geometries = {}  # (m, n, k) -> Geometry shared by every board of that shape
+
+# cell stores selectable when constructing a board with make_board
+ARRAY_BACKEND = 'array'         # Board: one byte per cell plus the incremental state the searches use
+BITBOARD_BACKEND = 'bitboard'   # BitBoard: one int mask per player plus an occupied mask
+
+
+class Geometry:
+    """
+    Everything about an m x n board with k to win that does not depend on the stones played:
+    cell ids, rays and k-length windows through every cell, neighbors, diagonals and zobrist keys.
+    Built once per (m, n, k) by get_geometry and shared (read only) by all boards
+    """
+
+    def __init__(self, size: Tuple[int, int], k: int):
+        self.size = size
+        self.k = k
+        rows, cols = size
+        self.n_cells = rows * cols
+        self.board_cell = np.arange(self.n_cells).reshape(size)
+        self.board_cell.flags.writeable = False
+
+        def on_board(x, y):
+            return 0 <= x < rows and 0 <= y < cols
+
+        def ray(x, y, dx, dy):
+            # the board is convex, so the on-board steps are always a prefix of the walk
+            return tuple((x + dx * i) * cols + y + dy * i for i in range(1, k) if on_board(x + dx * i, y + dy * i))
+
+        # rays[pos][d] = (forward cells, backward cells) from pos along LINE_DIRECTIONS[d], at most k - 1 each
+        self.rays = []
+        # neighbors[pos] = cells touching pos (including diagonals)
+        self.neighbors = []
+        for pos in range(self.n_cells):
+            x, y = divmod(pos, cols)
+            self.rays.append(tuple((ray(x, y, dx, dy), ray(x, y, -dx, -dy)) for dx, dy in LINE_DIRECTIONS))
+            self.neighbors.append(tuple((x + i) * cols + y + j for i, j in NEIGHBOR_OFFSETS if on_board(x + i, y + j)))
+
+        # windows = every k-long segment of a line (cells in order); cell_windows[pos] = ids of windows holding pos
+        self.windows = []
+        self.cell_windows = [[] for _ in range(self.n_cells)]
+        for pos in range(self.n_cells):
+            x, y = divmod(pos, cols)
+            for dx, dy in LINE_DIRECTIONS:
+                if on_board(x + dx * (k - 1), y + dy * (k - 1)):
+                    window = tuple((x + dx * i) * cols + y + dy * i for i in range(k))
+                    for cell in window:
+                        self.cell_windows[cell].append(len(self.windows))
+                    self.windows.append(window)
+        self.cell_windows = [tuple(ids) for ids in self.cell_windows]
+
+        # diagonals[pos] = (top left to bottom right cells, top right to bottom left cells) through pos, top row first
+        self.diagonals = []
+        for pos in range(self.n_cells):
+            x, y = divmod(pos, cols)
+            topleft = tuple(i * cols + y - x + i for i in range(rows) if on_board(i, y - x + i))
+            topright = tuple(i * cols + y + x - i for i in range(rows) if on_board(i, y + x - i))
+            self.diagonals.append((topleft, topright))
+
+        # random 64 bit key for every (cell, value); value 0 (empty) is always key 0
+        # the generator is seeded with the geometry so keys are the same in every process and every run
+        rng = np.random.default_rng([rows, cols, k])
+        keys = rng.integers(1, 2 ** 64, size=(self.n_cells, 2), dtype=np.uint64)
+        self.zobrist = tuple((0, int(keys[pos][0]), int(keys[pos][1])) for pos in range(self.n_cells))
+
+        # symmetries[s][pos] = where pos goes under symmetry s (s = 0 is the identity). A square board has the 8
+        # rotations/reflections of the square, a rectangular one only the 4 that keep its shape
+        transforms = [lambda x, y: (x, y),                            # identity
+                      lambda x, y: (rows - 1 - x, cols - 1 - y),      # rotate 180
+                      lambda x, y: (x, cols - 1 - y),                 # mirror left/right
+                      lambda x, y: (rows - 1 - x, y)]                 # mirror top/bottom
+        if rows == cols:
+            transforms += [lambda x, y: (y, rows - 1 - x),            # rotate 90 clockwise
+                           lambda x, y: (cols - 1 - y, x),            # rotate 90 counter clockwise
+                           lambda x, y: (y, x),                       # transpose
+                           lambda x, y: (cols - 1 - y, rows - 1 - x)]     # anti transpose
+        self.symmetries = []
+        for transform in transforms:
+            images = [transform(*divmod(pos, cols)) for pos in range(self.n_cells)]
+            self.symmetries.append(tuple(x * cols + y for x, y in images))
+        # symmetric_zobrist[pos][value] = zobrist key of (pos, value) as seen by each symmetry, so make_move can
+        # update the key of every symmetric version of the position in one pass
+        self.symmetric_zobrist = tuple(tuple(tuple(self.zobrist[perm[pos]][val] for perm in self.symmetries)
+                                             for val in range(3))
+                                       for pos in range(self.n_cells))
+        self.inverse_symmetries = []
+        for perm in self.symmetries:
+            inverse = [0] * self.n_cells
+            for pos, image in enumerate(perm):
+                inverse[image] = pos
+            self.inverse_symmetries.append(tuple(inverse))
+
+        # neighborhoods[radius][pos] = cells within Chebyshev distance radius of pos (not pos itself)
+        self.neighborhoods = {1: tuple(self.neighbors)}
+
+        # bitboard layout (see BitBoard): cell (x, y) is bit x * (cols + 1) + y. The extra bit at the end of
+        # every row is never set, so shifting a mask along a row or diagonal never wraps a line onto the next row
+        stride = cols + 1
+        self.bits = tuple(1 << (pos + pos // cols) for pos in range(self.n_cells))
+        self.bit_cells = {pos + pos // cols: pos for pos in range(self.n_cells)}    # bit index -> cell
+        self.full_mask = sum(self.bits)
+        # bit_run_shifts[d]: shifts that AND a mask down to the first cells of its runs of k along LINE_DIRECTIONS[d]
+        # (doubling the run length each step: a run of 2 needs one shift, of 4 two, of 5 three)
+        self.bit_run_shifts = []
+        for shift in [1, stride, stride + 1, stride - 1]:
+            shifts, length = [], 1
+            while length < k:
+                step = min(length, k - length)
+                shifts.append(shift * step)
+                length += step
+            self.bit_run_shifts.append(tuple(shifts))
+        # bit_run_starts[pos][d] = mask of the cells a run of k along LINE_DIRECTIONS[d] through pos can start at
+        self.bit_run_starts = []
+        for pos in range(self.n_cells):
+            x, y = divmod(pos, cols)
+            self.bit_run_starts.append(tuple(
+                sum(self.bits[(x - dx * i) * cols + y - dy * i] for i in range(k) if on_board(x - dx * i, y - dy * i))
+                for dx, dy in LINE_DIRECTIONS))
+
+    def get_neighborhoods(self, radius: int):
+        """
+        :param radius:
+        :return: cells within Chebyshev distance radius of every cell (built on first use)
+        """
+        if radius not in self.neighborhoods:
+            rows, cols = self.size
+            hoods = []
+            for pos in range(self.n_cells):
+                x, y = divmod(pos, cols)
+                hoods.append(tuple(i * cols + j
+                                   for i in range(max(x - radius, 0), min(x + radius + 1, rows))
+                                   for j in range(max(y - radius, 0), min(y + radius + 1, cols))
+                                   if (i, j) != (x, y)))
+            self.neighborhoods[radius] = tuple(hoods)
+        return self.neighborhoods[radius]
+
+
+def get_geometry(size: Tuple[int, int], k: int):
+    """
+    Return the shared Geometry for an m x n board with k to win (built on first use)
+    :param size:
+    :param k:
+    :return:
+    """
+    key = (size[0], size[1], k)
+    if key not in geometries:
+        geometries[key] = Geometry((size[0], size[1]), k)
+    return geometries[key]
+
+
+def restore_board(size, k, cells: bytes, gameover, winner, history):
+    """
+    Rebuild a pickled Board (see Board.__reduce__)
+    """
+    board = Board(size, k, board=np.frombuffer(cells, dtype=np.int8).reshape(size))
+    board.gameover = gameover
+    board.winner = winner
+    board.history = list(history)
+    return board
+
 
 class Board:
+    # fixed attribute layout: MCTS/alpha-beta keep many boards around and copy them often
+    __slots__ = ['k', 'size', 'gameover', 'winner', 'geometry', 'cells', 'board', 'board_cell',
+                 'empty_squares', 'empty_index', 'neighbor_counts', 'window_counts', 'window_empty_sum',
+                 'threat_refs', 'winning_squares', 'zobrist_table', 'zobrist_keys', 'history']
+
     def __init__(self, size: Tuple[int, int], k: int, board=None):
         self.k = k
         self.size = size
         self.gameover = False
         self.winner = 0
+        self.geometry = get_geometry(size, k)
+        # one byte per cell; self.board is a (m, n) int8 numpy view of the same memory
         if board is not None:
             # self.board = deepcopy(board)
-            self.board = np.array(board)
+            self.cells = bytearray(np.ascontiguousarray(board, dtype=np.int8).tobytes())
         else:
-            self.board = np.zeros(self.size, dtype=int)
-        self.board_cell = np.arange(self.size[0] * self.size[1]).reshape(self.size)
+            self.cells = bytearray(self.geometry.n_cells)
+        self.board = np.frombuffer(self.cells, dtype=np.int8).reshape(self.size)
+        self.board_cell = self.geometry.board_cell
+
+        # empty cells kept as a swap-remove list plus the index of each cell in that list (-1 if occupied)
+        # so make_move can add/remove a cell in O(1) and counting/random picks never rescan the board
+        self.empty_squares = [pos for pos in range(self.geometry.n_cells) if self.cells[pos] == 0]
+        self.empty_index = [-1] * (self.size[0] * self.size[1])
+        for i, pos in enumerate(self.empty_squares):
+            self.empty_index[pos] = i
+
+        # number of occupied neighbors (including diagonals) of every cell, adjusted by make_move
+        self.neighbor_counts = [0] * self.geometry.n_cells
+        for pos in range(self.geometry.n_cells):
+            if self.cells[pos] != 0:
+                for neighbor in self.geometry.neighbors[pos]:
+                    self.neighbor_counts[neighbor] += 1
+
+        # immediate threats: for every k-window, how many stones each player has in it and the sum of its empty
+        # cell ids. A window holding k - 1 stones of one player and none of the other has exactly one empty cell
+        # (= the sum) and taking it wins; winning_squares[player] is the set of such cells for that player and
+        # threat_refs[player][cell] counts the windows that put the cell there
+        geometry = self.geometry
+        self.window_counts = [None, [0] * len(geometry.windows), [0] * len(geometry.windows)]
+        self.window_empty_sum = [0] * len(geometry.windows)
+        for w, window in enumerate(geometry.windows):
+            for cell in window:
+                if self.cells[cell] == 0:
+                    self.window_empty_sum[w] += cell
+                else:
+                    self.window_counts[self.cells[cell]][w] += 1
+        self.threat_refs = [None, [0] * geometry.n_cells, [0] * geometry.n_cells]
+        self.winning_squares = [None, set(), set()]
+        for w in range(len(geometry.windows)):
+            self.add_window_threats(w)
+
+        # zobrist key of the position, XOR-updated by make_move
+        # zobrist_keys[s] is the key of the position transformed by geometry symmetry s (0 = as is)
+        self.zobrist_table = self.geometry.zobrist
+        self.zobrist_keys = [0] * len(self.geometry.symmetries)
+        for s, perm in enumerate(self.geometry.symmetries):
+            for pos in range(self.geometry.n_cells):
+                self.zobrist_keys[s] ^= self.zobrist_table[perm[pos]][self.cells[pos]]
+
+        # undo stack for push/pop: (pos, previous cell value, previous gameover, previous winner)
+        self.history = []
+
+    def clone(self):
+        """
+        Cheap copy of the board: copies the cell buffer, the incremental state lists and the scalars,
+        and shares the (read only) geometry
+        :return:
+        """
+        other = Board.__new__(Board)
+        other.k = self.k
+        other.size = self.size
+        other.gameover = self.gameover
+        other.winner = self.winner
+        other.geometry = self.geometry
+        other.cells = bytearray(self.cells)
+        other.board = np.frombuffer(other.cells, dtype=np.int8).reshape(self.size)
+        other.board_cell = self.board_cell
+        other.empty_squares = self.empty_squares[:]
+        other.empty_index = self.empty_index[:]
+        other.neighbor_counts = self.neighbor_counts[:]
+        other.window_counts = [None, self.window_counts[1][:], self.window_counts[2][:]]
+        other.window_empty_sum = self.window_empty_sum[:]
+        other.threat_refs = [None, self.threat_refs[1][:], self.threat_refs[2][:]]
+        other.winning_squares = [None, set(self.winning_squares[1]), set(self.winning_squares[2])]
+        other.zobrist_table = self.zobrist_table
+        other.zobrist_keys = self.zobrist_keys[:]
+        other.history = self.history[:]
+        return other
+
+    def __deepcopy__(self, memo):
+        # a plain deepcopy would copy self.board and self.cells separately and break the shared memory
+        return self.clone()
+
+    def __reduce__(self):
+        return restore_board, (self.size, self.k, bytes(self.cells), self.gameover, self.winner,
+                               self.history)
+
+    @property
+    def zobrist(self):
+        """
+        64 bit key identifying the stones on the board (does not include whose turn it is)
+        Two boards of the same geometry with the same stones always have the same key
+        :return:
+        """
+        return self.zobrist_keys[0]
+
+    def canonical_hash(self):
+        """
+        Zobrist key shared by all symmetric versions of the position (smallest key over the board symmetries)
+        Use this to key caches so symmetric positions share entries
+        :return:
+        """
+        return min(self.zobrist_keys)
+
+    def get_canonical_symmetry(self):
+        """
+        Index of the geometry symmetry that maps this position to its canonical version (the one whose key is
+        canonical_hash()). Map a move into the canonical frame with geometry.symmetries[s][pos] and back
+        with geometry.inverse_symmetries[s][pos]
+        :return:
+        """
+        return self.zobrist_keys.index(min(self.zobrist_keys))
+
+    def canonical_form(self):
+        """
+        Canonical version of the position: the lexicographically smallest cell layout over the board symmetries
+        :return: (m, n) int8 array
+        """
+        n_cells = self.geometry.n_cells
+        forms = []
+        for inverse in self.geometry.inverse_symmetries:
+            forms.append(bytes(self.cells[inverse[pos]] for pos in range(n_cells)))
+        return np.frombuffer(min(forms), dtype=np.int8).reshape(self.size).copy()
+
+    def get_symmetries(self):
+        """
+        Symmetries that leave the current position unchanged (always includes the identity, 0)
+        :return:
+        """
+        res = []
+        cells = self.cells
+        for s, perm in enumerate(self.geometry.symmetries):
+            # cheap key check first, then confirm cell by cell
+            if self.zobrist_keys[s] == self.zobrist_keys[0] and \
+                    all(cells[perm[pos]] == cells[pos] for pos in range(self.geometry.n_cells)):
+                res.append(s)
+        return res
+
+    def get_symmetry_distinct_moves(self):
+        """
+        Empty squares with symmetric duplicates removed: two moves are duplicates if a symmetry that leaves the
+        position unchanged maps one onto the other. On an empty square board this keeps 1/8 of the moves
+        :return: sorted list with the lowest cell id of each group
+        """
+        symmetries = [self.geometry.symmetries[s] for s in self.get_symmetries()]
+        if len(symmetries) == 1:
+            return self.get_empty_squares()
+        res = []
+        seen = set()
+        for pos in self.get_empty_squares():
+            if pos in seen:
+                continue
+            res.append(pos)
+            for perm in symmetries:
+                seen.add(perm[pos])
+        return res
 
     def get_diagonal(self, coord: Tuple[int, int], vec: Tuple[int, int]):
         res = []
@@ -44,7 +367,7 @@ class Board:
             assert self.gameover
             return True
 
-        if len(self.get_empty_squares()) == 0:
+        if len(self.empty_squares) == 0:
             self.gameover = True
         return self.gameover
 
@@ -67,12 +390,122 @@ class Board:
     #     return empty_squares
 
     def get_empty_squares(self):
-        return list(self.board_cell[self.board == 0])
+        return sorted(self.empty_squares)
+
+    def get_empty_count(self):
+        return len(self.empty_squares)
+
+    def get_nearby_squares(self, radius: int):
+        """
+        Empty squares within Chebyshev distance radius of a stone, the only ones usually worth considering on a
+        large board. An empty board returns its center square
+        :param radius:
+        :return: sorted list
+        """
+        n_cells = self.geometry.n_cells
+        if len(self.empty_squares) == n_cells:
+            rows, cols = self.size
+            return [(rows // 2) * cols + cols // 2]
+        if radius == 1:
+            counts = self.neighbor_counts
+            return sorted(pos for pos in self.empty_squares if counts[pos] > 0)
+        hoods = self.geometry.get_neighborhoods(radius)
+        cells = self.cells
+        nearby = set()
+        for pos in range(n_cells):
+            if cells[pos]:
+                nearby.update(hoods[pos])
+        return sorted(pos for pos in nearby if cells[pos] == 0)
+
+    def iter_empty_squares(self):
+        """
+        Iterate the empty cells without copying or sorting them (order is arbitrary)
+        The board must not be changed while iterating
+        :return:
+        """
+        return iter(self.empty_squares)
 
     def get_random_empty_square(self):
         # of the empty cells, return a randomly selected one
-        empty_squares = self.get_empty_squares()
-        return empty_squares[random.randrange(len(empty_squares))]
+        return self.empty_squares[random.randrange(len(self.empty_squares))]
+
+    def remove_empty_square(self, pos: int):
+        # move the last empty cell into the slot of pos, then drop the last slot
+        i = self.empty_index[pos]
+        last = self.empty_squares.pop()
+        if last != pos:
+            self.empty_squares[i] = last
+            self.empty_index[last] = i
+        self.empty_index[pos] = -1
+
+    def add_window_threats(self, w: int):
+        # if window w is one stone short of k for a player (and the other player is not in it), its empty cell wins
+        count_x, count_o = self.window_counts[1][w], self.window_counts[2][w]
+        if count_x == self.k - 1 and count_o == 0:
+            cell = self.window_empty_sum[w]
+            self.threat_refs[1][cell] += 1
+            if self.threat_refs[1][cell] == 1:
+                self.winning_squares[1].add(cell)
+        if count_o == self.k - 1 and count_x == 0:
+            cell = self.window_empty_sum[w]
+            self.threat_refs[2][cell] += 1
+            if self.threat_refs[2][cell] == 1:
+                self.winning_squares[2].add(cell)
+
+    def remove_window_threats(self, w: int):
+        # undo add_window_threats for window w (called before the window's counts change)
+        count_x, count_o = self.window_counts[1][w], self.window_counts[2][w]
+        if count_x == self.k - 1 and count_o == 0:
+            cell = self.window_empty_sum[w]
+            self.threat_refs[1][cell] -= 1
+            if self.threat_refs[1][cell] == 0:
+                self.winning_squares[1].discard(cell)
+        if count_o == self.k - 1 and count_x == 0:
+            cell = self.window_empty_sum[w]
+            self.threat_refs[2][cell] -= 1
+            if self.threat_refs[2][cell] == 0:
+                self.winning_squares[2].discard(cell)
+
+    def update_windows(self, pos: int, previous, val):
+        """
+        Update the window counts and winning squares for every window through pos after pos changed
+        from previous to val
+        :param pos:
+        :param previous:
+        :param val:
+        """
+        window_counts = self.window_counts
+        window_empty_sum = self.window_empty_sum
+        for w in self.geometry.cell_windows[pos]:
+            self.remove_window_threats(w)
+            if previous != 0:
+                window_counts[previous][w] -= 1
+                window_empty_sum[w] += pos
+            if val != 0:
+                window_counts[val][w] += 1
+                window_empty_sum[w] -= pos
+            self.add_window_threats(w)
+
+    def get_winning_squares(self, player):
+        """
+        Empty cells that would give player k in a row (maintained incrementally, do not modify the set)
+        :param player:
+        :return:
+        """
+        return self.winning_squares[player]
+
+    def is_winning_move(self, pos: int, player):
+        """
+        True if player taking the (empty) square pos completes k in a row, O(1)
+        :param pos:
+        :param player:
+        :return:
+        """
+        return pos in self.winning_squares[player]
+
+    def add_empty_square(self, pos: int):
+        self.empty_index[pos] = len(self.empty_squares)
+        self.empty_squares.append(pos)
 
     def is_within_board_pos(self, pos: int):
         return 0 <= pos < self.size[0] * self.size[1]
@@ -84,8 +517,7 @@ class Board:
         return pos // self.size[1], pos % self.size[1]
 
     def is_empty_pos(self, pos: int):
-        x, y = self.pos_to_xy(pos)
-        return self.board[x][y] == 0
+        return self.empty_index[pos] != -1
 
     def is_move_OK(self, pos: int):
         return self.is_within_board_pos(pos) and self.is_empty_pos(pos)
@@ -96,13 +528,56 @@ class Board:
         :param pos:
         :param val: 0: empty, 1: X player; 2: O player
         """
-        x, y = self.pos_to_xy(pos)
-        self.board[x][y] = val
+        pos = int(pos)
+        previous = self.cells[pos]
+        self.cells[pos] = val
+        symmetric_zobrist = self.geometry.symmetric_zobrist[pos]
+        self.zobrist_keys = [key ^ old ^ new for key, old, new in
+                             zip(self.zobrist_keys, symmetric_zobrist[previous], symmetric_zobrist[val])]
+        if previous == 0 and val != 0:
+            self.remove_empty_square(pos)
+            for neighbor in self.geometry.neighbors[pos]:
+                self.neighbor_counts[neighbor] += 1
+        elif previous != 0 and val == 0:
+            self.add_empty_square(pos)
+            for neighbor in self.geometry.neighbors[pos]:
+                self.neighbor_counts[neighbor] -= 1
+        if previous != val:
+            self.update_windows(pos, previous, val)
 
         # if this is the final move of the game, check for winner
-        if len(self.get_empty_squares()) == 0:
+        if len(self.empty_squares) == 0:
             self.is_win(pos, val)
 
+    def push(self, pos: int, player):
+        """
+        Make a move that can be taken back with pop()
+        Search algos use push/pop on a single board instead of copying the board for every child
+        :param pos:
+        :param player: 1: X player; 2: O player
+        """
+        self.history.append((pos, int(self.cells[pos]), self.gameover, self.winner))
+        self.make_move(pos, player)
+
+    def pop(self):
+        """
+        Undo the most recent push(), restoring the cell, gameover, winner and all incremental state
+        :return:    the square that was freed
+        """
+        pos, previous, gameover, winner = self.history.pop()
+        self.make_move(pos, previous)
+        self.gameover = gameover
+        self.winner = winner
+        return pos
+
+    def pop_to(self, depth: int):
+        """
+        Undo pushes until only depth moves remain on the undo stack
+        :param depth:
+        """
+        while len(self.history) > depth:
+            self.pop()
+
     def did_player_win(self, player):
         """
         Once the board has been filled, return True only if the given player won
@@ -116,10 +591,12 @@ class Board:
         return self.winner == player
 
     def get_diagonal_topleft(self, r: int, c: int):
-        return self.get_diagonal((r, c), (-1, -1)) + [self.board[r][c]] + self.get_diagonal((r, c), (1, 1))
+        cells = self.cells
+        return [cells[pos] for pos in self.geometry.diagonals[self.xy_to_pos(r, c)][0]]
 
     def get_diagonal_topright(self, r: int, c: int):
-        return self.get_diagonal((r, c), (-1, 1)) + [self.board[r][c]] + self.get_diagonal((r, c), (1, -1))
+        cells = self.cells
+        return [cells[pos] for pos in self.geometry.diagonals[self.xy_to_pos(r, c)][1]]
 
     def is_game_ending_move(self, pos: int):
         """
@@ -127,43 +604,40 @@ class Board:
         :param pos:
         :return:    True if taking the square wins the game for either player, else false
         """
-        game_over = False
-        for player in [1, 2]:
-            self.make_move(pos, player)
-            if self.is_win(pos, player):
-                game_over = True
-                break
+        # the winning squares of both players are kept up to date by make_move
+        return pos in self.winning_squares[1] or pos in self.winning_squares[2]
 
-        self.make_move(pos, 0)  # be sure to undo move
-        return game_over
+    def count_run(self, pos: int, val):
+        """
+        Walk outward from pos in each of the four line directions counting contiguous val stones
+        Stops as soon as k stones are found, so at most 4 * 2 * (k - 1) cells are read
+        :param pos:
+        :param val:
+        :return:    length of the longest run of val through pos (capped at k), 0 if pos is not val
+        """
+        cells = self.cells
+        if val == 0 or cells[pos] != val:
+            return 0
+
+        longest = 1
+        for forward, backward in self.geometry.rays[pos]:
+            run = 1
+            for cell in forward:
+                if cells[cell] != val:
+                    break
+                run += 1
+            for cell in backward:
+                if run >= self.k or cells[cell] != val:
+                    break
+                run += 1
+            if run >= self.k:
+                return run
+            longest = max(longest, run)
+        return longest
 
     def is_win(self, pos: int, val):  # Literal[0, 1, 2]):
         assert val in [0, 1, 2]
-        flag = False
-        x, y = self.pos_to_xy(pos)
-        matrix = self.board
-
-        horizon = matrix[x]
-        vertical = matrix[:, y]
-        topleft_dg = self.get_diagonal_topleft(x, y)
-        topright_dg = self.get_diagonal_topright(x, y)
-
-        lines = [horizon, vertical, topleft_dg, topright_dg]
-        # print(f'{pos=}, {x=}, {y=}, {lines=}')
-
-        player = ['.', 'X', 'O']  # converting -1, 1, 0 to O, X, .
-        if val == 1 or val == 2:
-            k_pieces = player[val] * self.k
-        else:
-            k_pieces = '#' * self.k
-
-        for line in lines:
-            y = ''
-            for elem in line:
-                y += player[elem]
-                if k_pieces in y:
-                    flag = True
-                    break
+        flag = self.count_run(pos, val) >= self.k
 
         if flag:
             self.gameover = True
@@ -176,7 +650,7 @@ class Board:
         :return:
         """
 
-        if len(self.get_empty_squares()) > 0:
+        if len(self.empty_squares) > 0:
             return False
         # return True if the winner is neither player 1 or 2
         return self.winner == 0
@@ -188,7 +662,7 @@ class Board:
         :param player:
         :return:
         """
-        if len(self.get_empty_squares()) > 0:
+        if len(self.empty_squares) > 0:
             return False
         # a tie is not a loss
         if self.is_tie():
@@ -239,20 +713,19 @@ class Board:
         :return:
         """
         counts = defaultdict(int)
-        for cell in self.get_empty_squares():
-            x, y = self.pos_to_xy(cell)
-            # check the cells to the left, left up, up, up right,
-            #                        right, down right, down, down left
-            # if valid cell and empty, increment counter
-            counts[cell] = 0
-            for i, j in [(-1, 0), (-1, 1), (0, 1), (1, 1),
-                         (1, 0), (1, -1), (0, -1), (-1, -1)]:
-                if self.is_within_board_cell((x + i, y + j)) and self.board[x + i][y + j] != 0:
-                    counts[cell] += 1
-                    # print(f'Cell {cell} has occupied neighbor {x + i},{y + j} {self.board[x + i][y + j]}')
+        for cell in self.empty_squares:
+            counts[cell] = self.neighbor_counts[cell]  # maintained by make_move
 
         return counts
 
+    def get_neighbor_count(self, pos: int):
+        """
+        Number of filled cells touching pos (including diagonals), O(1)
+        :param pos:
+        :return:
+        """
+        return self.neighbor_counts[pos]
+
     def get_emtpy_cell_priority_queue(self, player):
         """
         Return a priority queue for the empty cells, ordered by cells with most filled cells
@@ -260,10 +733,10 @@ class Board:
         :return:
         """
         queue = PriorityQueue()
-        cells_counts = self.get_emtpy_cell_neighbor_count()
+        cells_counts = self.neighbor_counts
         # print(f'{cells_counts}')
-        if len(cells_counts) > 0:
-            for cell in cells_counts.keys():
+        if self.get_empty_count() > 0:
+            for cell in self.empty_squares:
                 # if a win, set the value as negative 9; no cell can have more than 8 neighbors, so this will
                 # ensure the cell is at the front of the priority queue (lowest numbers first)
                 if self.is_game_ending_move(cell):
@@ -284,10 +757,10 @@ class Board:
         :return:
         """
         queue = []
-        cells_counts = self.get_emtpy_cell_neighbor_count()
+        cells_counts = self.neighbor_counts
         # print(f'{cells_counts}')
-        if len(cells_counts) > 0:
-            for cell in cells_counts.keys():
+        if self.get_empty_count() > 0:
+            for cell in self.empty_squares:
                 # if a win, set the value as negative 9; no cell can have more than 8 neighbors, so this will
                 # ensure the cell is at the front of the priority queue (lowest numbers first)
                 if self.is_game_ending_move(cell):
@@ -318,6 +791,195 @@ class Board:
         raise Exception('Do not use until the get_cells heuristic above is completed')
 
 
+class BitBoard:
+    """
+    Board stored as three ints: the cells of X, the cells of O and the occupied cells (layout in Geometry).
+    Moves, copies and win checks are a handful of integer operations; cells and board are built from the
+    masks only when asked for. There is none of Board's incremental search state (winning squares, window
+    counts, zobrist keys), so this backend is meant for random playouts, see mcts.playout
+    """
+    __slots__ = ['k', 'size', 'gameover', 'winner', 'geometry', 'masks', 'history']
+
+    def __init__(self, size: Tuple[int, int], k: int, board=None):
+        self.k = k
+        self.size = size
+        self.gameover = False
+        self.winner = 0
+        self.geometry = get_geometry(size, k)
+        # masks[0]: occupied cells, masks[1]: X cells, masks[2]: O cells
+        self.masks = [0, 0, 0]
+        if board is not None:
+            bits = self.geometry.bits
+            for pos, val in enumerate(np.ravel(board)):
+                if val:
+                    self.masks[val] |= bits[pos]
+            self.masks[0] = self.masks[1] | self.masks[2]
+        # undo stack for push/pop: (pos, previous cell value, previous gameover, previous winner)
+        self.history = []
+
+    @classmethod
+    def from_board(cls, board: Board):
+        """
+        BitBoard with the stones of a Board (history, gameover and winner are not copied)
+        :param board:
+        :return:
+        """
+        other = cls(board.size, board.k)
+        bits = board.geometry.bits
+        cells = board.cells
+        for pos in range(board.geometry.n_cells):
+            if cells[pos]:
+                other.masks[cells[pos]] |= bits[pos]
+        other.masks[0] = other.masks[1] | other.masks[2]
+        return other
+
+    def clone(self):
+        other = BitBoard.__new__(BitBoard)
+        other.k = self.k
+        other.size = self.size
+        other.gameover = self.gameover
+        other.winner = self.winner
+        other.geometry = self.geometry
+        other.masks = self.masks[:]
+        other.history = self.history[:]
+        return other
+
+    def __deepcopy__(self, memo):
+        return self.clone()
+
+    @property
+    def cells(self):
+        """
+        One byte per cell, built from the masks (a copy: writing to it does not change the board)
+        :return:
+        """
+        _, xs, os = self.masks
+        return bytearray(1 if xs & bit else 2 if os & bit else 0 for bit in self.geometry.bits)
+
+    @property
+    def board(self):
+        """
+        (m, n) int8 matrix built from the masks (a copy, like cells)
+        :return:
+        """
+        return np.frombuffer(self.cells, dtype=np.int8).reshape(self.size)
+
+    def get_cell(self, pos: int):
+        bit = self.geometry.bits[pos]
+        return 1 if self.masks[1] & bit else 2 if self.masks[2] & bit else 0
+
+    def make_move(self, pos: int, val):
+        """
+
+        :param pos:
+        :param val: 0: empty, 1: X player; 2: O player
+        """
+        bit = self.geometry.bits[pos]
+        masks = self.masks
+        masks[1] &= ~bit
+        masks[2] &= ~bit
+        if val:
+            masks[val] |= bit
+        masks[0] = masks[1] | masks[2]
+
+        # if this is the final move of the game, check for winner
+        if masks[0] == self.geometry.full_mask:
+            self.is_win(pos, val)
+
+    def push(self, pos: int, player):
+        self.history.append((pos, self.get_cell(pos), self.gameover, self.winner))
+        self.make_move(pos, player)
+
+    def pop(self):
+        pos, previous, gameover, winner = self.history.pop()
+        self.make_move(pos, previous)
+        self.gameover = gameover
+        self.winner = winner
+        return pos
+
+    def is_win(self, pos: int, val):
+        """
+        Shift-and-AND win check: in each direction, AND the mask of val with itself shifted along the line
+        until only the first cells of runs of k are left, then keep the runs that can pass through pos
+        :param pos:
+        :param val:
+        :return:    True if val has k in a row through pos
+        """
+        assert val in [0, 1, 2]
+        if val == 0:
+            return False
+        mask = self.masks[val]
+        if not mask & self.geometry.bits[pos]:
+            return False
+        for shifts, starts in zip(self.geometry.bit_run_shifts, self.geometry.bit_run_starts[pos]):
+            runs = mask
+            for shift in shifts:
+                runs &= runs >> shift
+            if runs & starts:
+                self.gameover = True
+                self.winner = val
+                return True
+        return False
+
+    def get_empty_count(self):
+        return self.geometry.n_cells - self.masks[0].bit_count()
+
+    def get_empty_squares(self):
+        # walk the set bits of the free mask, lowest first (same order as Board)
+        empty_squares = []
+        bit_cells = self.geometry.bit_cells
+        free = self.geometry.full_mask & ~self.masks[0]
+        while free:
+            low = free & -free
+            empty_squares.append(bit_cells[low.bit_length() - 1])
+            free ^= low
+        return empty_squares
+
+    def get_random_empty_square(self):
+        # O(empty cells); a playout should shuffle get_empty_squares() once instead
+        empty_squares = self.get_empty_squares()
+        return empty_squares[random.randrange(len(empty_squares))]
+
+    def is_empty_pos(self, pos: int):
+        return not self.masks[0] & self.geometry.bits[pos]
+
+    def is_move_OK(self, pos: int):
+        return self.is_within_board_pos(pos) and self.is_empty_pos(pos)
+
+    def is_gameover(self, pos: int, val):
+        if self.is_win(pos, val) or self.masks[0] == self.geometry.full_mask:
+            self.gameover = True
+        return self.gameover
+
+    def is_tie(self):
+        return self.masks[0] == self.geometry.full_mask and self.winner == 0
+
+    def is_loss(self, player):
+        return self.masks[0] == self.geometry.full_mask and self.winner not in [0, player]
+
+    # these only read size, board and history, so they work the same on both boards
+    __str__ = Board.__str__
+    show = Board.show
+    xy_to_pos = Board.xy_to_pos
+    pos_to_xy = Board.pos_to_xy
+    is_within_board_pos = Board.is_within_board_pos
+    is_within_board_cell = Board.is_within_board_cell
+    did_player_win = Board.did_player_win
+    pop_to = Board.pop_to
+
+
+def make_board(size: Tuple[int, int], k: int, board=None, backend=ARRAY_BACKEND):
+    """
+    :param size:
+    :param k:
+    :param board: optional (m, n) matrix of cell values
+    :param backend: ARRAY_BACKEND (Board) or BITBOARD_BACKEND (BitBoard)
+    :return:
+    """
+    board_classes = {ARRAY_BACKEND: Board, BITBOARD_BACKEND: BitBoard}
+    return board_classes[backend](size, k, board=board)
+
+
 # def test():
 
 
@@ -420,6 +1082,26 @@ class TestBoard(unittest.TestCase):
     # def test_diagonal(self):
     # board = Board((5, 4), 3)
 
+    def test_is_win_diagonals(self):
+        """
+        Wins on both diagonals that do not start at the edge of the board
+        """
+        # down-right diagonal (1, 0), (2, 1), (3, 2) on a 5x4 board, last stone placed at the top end
+        board = Board((5, 4), 3)
+        for pos in [9, 14]:
+            board.make_move(pos, 2)
+        board.make_move(4, 2)
+        self.assertTrue(board.is_win(4, 2))
+        self.assertEqual(board.count_run(9, 2), 3)
+
+        # down-left diagonal (0, 3), (1, 2), (2, 1) with the last stone in the middle
+        board = Board((5, 4), 3)
+        for pos in [3, 9, 6]:
+            board.make_move(pos, 1)
+        self.assertTrue(board.is_win(6, 1))
+        self.assertFalse(board.is_win(6, 2))
+        self.assertFalse(board.is_win(0, 1), 'Empty cell is never part of a win')
+
     def test_make_move(self):
         # test rectangular board
         board = Board((5, 4), 3)
@@ -460,6 +1142,16 @@ class TestBoard(unittest.TestCase):
             # print(neighbor_dict)
             self.assertEqual(neighbor_dict[4],
                              neighbors)  # after a new cell taken, ensure cell 4 (middle) neighbor count increased
+            self.assertEqual(board.get_neighbor_count(4), neighbors)
+
+        # freeing cells (pop or make_move with 0) lowers the counts again
+        board.push(4, 2)
+        self.assertEqual(board.get_neighbor_count(0), 3)
+        board.pop()
+        self.assertEqual(board.get_neighbor_count(0), 2)
+        board.make_move(1, 0)
+        self.assertEqual(board.get_neighbor_count(4), neighbors - 1)
+        self.assertEqual(board.get_neighbor_count(0), 1)
 
     def test_get_emtpy_cell_priority_queue(self):
         """
@@ -513,10 +1205,293 @@ class TestBoard(unittest.TestCase):
         b.make_move(2, 1)
         empty_squares = b.get_empty_squares()
         self.assertEqual(empty_squares, [0, 1, 3, 4, 5, 6, 7, 8, 9, 10, 11])
-        # print('print')
-        # b.show()
-        # print(b.get_empty_squares())
-        # print(b)
+
+    def test_push_pop(self):
+        """
+        pop() restores the board exactly, including a win found after the push
+        """
+        board = Board((3, 3), 3)
+        for pos, player in [(0, 1), (4, 2), (1, 1), (5, 2)]:
+            board.make_move(pos, player)
+        before = board.board.copy()
+        empty_before = board.get_empty_squares()
+
+        board.push(2, 1)
+        self.assertTrue(board.is_win(2, 1))
+        board.push(3, 2)
+        self.assertEqual(board.pop(), 3)
+        self.assertTrue(board.gameover)
+        self.assertEqual(board.pop(), 2)
+
+        self.assertFalse(board.gameover)
+        self.assertEqual(board.winner, 0)
+        self.assertTrue((board.board == before).all())
+        self.assertEqual(board.get_empty_squares(), empty_before)
+        self.assertEqual(board.history, [])
+
+        # checking a winning square does not leave the board flagged as won
+        self.assertTrue(board.is_game_ending_move(2))
+        self.assertFalse(board.gameover)
+        self.assertEqual(board.winner, 0)
+
+    def test_zobrist(self):
+        """
+        Zobrist key depends only on the stones on the board, not on move order, and survives push/pop
+        """
+        board = Board((4, 4), 3)
+        self.assertEqual(board.zobrist, 0)
+        for pos, player in [(0, 1), (5, 2), (10, 1)]:
+            board.make_move(pos, player)
+        other = Board((4, 4), 3)
+        for pos, player in [(10, 1), (0, 1), (5, 2)]:
+            other.push(pos, player)
+        self.assertEqual(board.zobrist, other.zobrist)
+        self.assertEqual(Board((4, 4), 3, board=board.board).zobrist, board.zobrist)
+
+        key = board.zobrist
+        board.push(3, 2)
+        self.assertNotEqual(board.zobrist, key)
+        board.pop()
+        self.assertEqual(board.zobrist, key)
+
+        # same cells, different owner
+        swapped = Board((4, 4), 3)
+        for pos, player in [(0, 2), (5, 2), (10, 1)]:
+            swapped.make_move(pos, player)
+        self.assertNotEqual(swapped.zobrist, board.zobrist)
+
+    def test_geometry(self):
+        """
+        Geometry is shared per (m, n, k) and has the expected windows, neighbors, rays and diagonals
+        """
+        self.assertIs(Board((3, 3), 3).geometry, Board((3, 3), 3).geometry)
+        self.assertIsNot(Board((3, 3), 3).geometry, Board((3, 3), 2).geometry)
+
+        geometry = get_geometry((3, 3), 3)
+        self.assertEqual(len(geometry.windows), 8)     # 3 rows, 3 cols, 2 diagonals
+        self.assertEqual(len(geometry.cell_windows[4]), 4)
+        self.assertEqual(len(geometry.cell_windows[0]), 3)
+        self.assertEqual(len(geometry.cell_windows[1]), 2)
+        self.assertEqual(sorted(geometry.neighbors[0]), [1, 3, 4])
+        self.assertEqual(len(geometry.neighbors[4]), 8)
+
+        geometry = get_geometry((5, 4), 3)
+        self.assertEqual(geometry.rays[4][2], ((9, 14), ()))        # down-right from (1, 0)
+        self.assertEqual(geometry.rays[6][3], ((9, 12), (3,)))      # down-left from (1, 2)
+        self.assertEqual(geometry.diagonals[9], ((4, 9, 14, 19), (3, 6, 9, 12)))
+
+    def test_winning_squares(self):
+        """
+        Incremental winning squares match placing each player's stone on every empty cell and checking is_win
+        """
+        random.seed(531)
+        for size, k in [((3, 3), 3), ((5, 4), 3), ((6, 6), 4), ((4, 4), 1)]:
+            for _ in range(10):
+                board = Board(size, k)
+                player = 1
+                while board.get_empty_count() > 0 and not board.gameover:
+                    for p in [1, 2]:
+                        expected = set()
+                        for pos in board.get_empty_squares():
+                            board.push(pos, p)
+                            if board.is_win(pos, p):
+                                expected.add(pos)
+                            board.pop()
+                        self.assertEqual(board.get_winning_squares(p), expected)
+                    pos = board.get_random_empty_square()
+                    board.push(pos, player)
+                    board.is_win(pos, player)
+                    player = 2 if player == 1 else 1
+
+                # undo the whole game, nobody has a winning square on an empty board (unless k is 1)
+                board.pop_to(0)
+                self.assertEqual(len(board.get_winning_squares(1)), board.get_empty_count() if k == 1 else 0)
+                if k > 1:
+                    self.assertEqual(board.threat_refs[2], [0] * board.geometry.n_cells)
+
+    def test_clone(self):
+        """
+        A clone (also via deepcopy and pickle) is independent of the original and keeps all incremental state
+        """
+        board = Board((4, 4), 3)
+        for pos, player in [(0, 1), (5, 1), (3, 2)]:
+            board.push(pos, player)
+
+        for other in [board.clone(), deepcopy(board), pickle.loads(pickle.dumps(board))]:
+            self.assertEqual(other.zobrist, board.zobrist)
+            self.assertEqual(other.get_empty_squares(), board.get_empty_squares())
+            self.assertEqual(other.get_winning_squares(1), {10})
+            other.push(10, 1)
+            self.assertTrue(other.is_win(10, 1))
+            self.assertEqual(other.board[2][2], 1)
+            self.assertEqual(board.board[2][2], 0)
+            self.assertFalse(board.gameover)
+            self.assertEqual(board.get_winning_squares(1), {10})
+            other.pop_to(0)
+            self.assertEqual(other.get_empty_count(), 16)
+
+    def test_board_view(self):
+        """
+        board.board is an int8 view of the cell buffer, so both always agree
+        """
+        board = Board((3, 4), 3, board=[[0, 1, 0, 0], [2, 0, 0, 0], [0, 0, 0, 1]])
+        self.assertEqual(board.board.dtype, np.int8)
+        self.assertEqual(board.get_empty_count(), 9)
+        board.make_move(6, 2)
+        self.assertEqual(board.board[1][2], 2)
+        self.assertEqual(bytes(board.cells), bytes([0, 1, 0, 0, 2, 0, 2, 0, 0, 0, 0, 1]))
+        with self.assertRaises(AttributeError):
+            board.scratch = 1   # __slots__
+
+    def test_nearby_squares(self):
+        board = Board((7, 7), 5)
+        self.assertEqual(board.get_nearby_squares(2), [24])     # empty board: center
+        board.make_move(0, 1)
+        self.assertEqual(board.get_nearby_squares(1), [1, 7, 8])
+        self.assertEqual(board.get_nearby_squares(2), [1, 2, 7, 8, 9, 14, 15, 16])
+        board.make_move(48, 2)
+        self.assertEqual(len(board.get_nearby_squares(2)), 16)
+        self.assertEqual(len(board.get_nearby_squares(7)), 47)
+
+    def test_symmetries(self):
+        """
+        Symmetric positions share a canonical hash/form and symmetric moves are only listed once
+        """
+        self.assertEqual(len(get_geometry((3, 3), 3).symmetries), 8)
+        self.assertEqual(len(get_geometry((3, 4), 3).symmetries), 4)
+
+        # empty boards: 3 distinct moves on 3x3 (corner, edge, center), 4 on 3x4
+        self.assertEqual(Board((3, 3), 3).get_symmetry_distinct_moves(), [0, 1, 4])
+        self.assertEqual(Board((3, 4), 3).get_symmetry_distinct_moves(), [0, 1, 4, 5])
+
+        # X in the center: corners and edges are still equivalent
+        board = Board((3, 3), 3)
+        board.make_move(4, 1)
+        self.assertEqual(board.get_symmetry_distinct_moves(), [0, 1])
+        board.make_move(0, 2)  # only the main diagonal mirror remains
+        self.assertEqual(board.get_symmetry_distinct_moves(), [1, 2, 5, 8])
+
+        # the same shape in every corner of a 4x4 board
+        geometry = get_geometry((4, 4), 3)
+        keys, forms, canonical_stones = set(), set(), set()
+        for perm in geometry.symmetries:
+            board = Board((4, 4), 3)
+            for pos, player in [(0, 1), (1, 2), (6, 1)]:
+                board.push(perm[pos], player)
+            keys.add(board.canonical_hash())
+            forms.add(board.canonical_form().tobytes())
+            # the canonical symmetry maps every variant onto the same stones
+            s = board.get_canonical_symmetry()
+            canonical_stones.add(frozenset((geometry.symmetries[s][pos], board.cells[pos]) for pos in range(16)
+                                           if board.cells[pos]))
+            board.pop_to(0)
+            self.assertEqual(board.zobrist_keys, [0] * 8)
+        self.assertEqual(len(keys), 1)
+        self.assertEqual(len(forms), 1)
+        self.assertEqual(len(canonical_stones), 1)
+
+    def test_empty_square_tracking(self):
+        """
+        The incremental empty cell list stays in sync when cells are taken and freed again
+        """
+        random.seed(531)
+        board = Board((4, 5), 4)
+        taken = []
+        for _ in range(12):
+            pos = board.get_random_empty_square()
+            board.make_move(pos, 1 + len(taken) % 2)
+            taken.append(pos)
+        board.make_move(taken[3], 0)    # freeing a cell puts it back in the list
+        board.make_move(taken[7], 0)
+        expected = [pos for pos in range(20) if pos not in taken or pos in [taken[3], taken[7]]]
+        self.assertEqual(board.get_empty_squares(), expected)
+        self.assertEqual(sorted(board.iter_empty_squares()), expected)
+        self.assertEqual(board.get_empty_count(), len(expected))
+        self.assertIn(board.get_random_empty_square(), expected)
+        for i, pos in enumerate(board.empty_squares):
+            self.assertEqual(board.empty_index[pos], i)
+
+    def test_is_win_directions(self):
+        """
+        Wins are found in all four directions on a rectangular board and lines do not wrap across rows
+        """
+        for line in [[5, 6, 7], [1, 5, 9], [0, 5, 10], [3, 6, 9]]:
+            board = Board((4, 4), 3)
+            for pos in line:
+                board.make_move(pos, 2)
+            self.assertTrue(board.is_win(line[-1], 2), f'Player 2 wins with {line}')
+            self.assertFalse(board.is_win(line[-1], 1), f'Player 1 does not win with {line}')
+
+        # cells 2, 3 on row 0 and 4 on row 1 are consecutive ids but not a line
+        board = Board((4, 4), 3)
+        for pos in [2, 3, 4]:
+            board.make_move(pos, 1)
+        self.assertFalse(board.is_win(4, 1))
+
+    def test_is_win_matches_reference(self):
+        """
+        Play random games and compare is_win with a brute force scan of the matrix
+        """
+        def has_k_in_row(matrix, k, player):
+            rows, cols = matrix.shape
+            for x in range(rows):
+                for y in range(cols):
+                    for dx, dy in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+                        if all(0 <= x + i * dx < rows and 0 <= y + i * dy < cols and
+                               matrix[x + i * dx][y + i * dy] == player for i in range(k)):
+                            return True
+            return False
+
+        random.seed(531)
+        for size, k in itertools.product([(3, 3), (5, 4), (7, 7)], [3, 5]):
+            for _ in range(20):
+                board = Board(size, k)
+                player = 1
+                while board.get_empty_squares():
+                    self.assertEqual(board.get_empty_squares(), list(board.board_cell[board.board == 0]))
+                    pos = board.get_random_empty_square()
+                    board.make_move(pos, player)
+                    self.assertEqual(board.is_win(pos, player), has_k_in_row(board.board, k, player))
+                    if board.gameover:
+                        break
+                    player = 2 if player == 1 else 1
+
+    def test_bitboard(self):
+        """
+        BitBoard agrees with Board move by move in random games, and push/pop and clone leave it as it was
+        """
+        random.seed(531)
+        for size, k in itertools.product([(3, 3), (5, 4), (4, 6), (7, 7)], [1, 3, 5]):
+            for _ in range(10):
+                board, bitboard = Board(size, k), make_board(size, k, backend=BITBOARD_BACKEND)
+                self.assertIsInstance(bitboard, BitBoard)
+                player = 1
+                while board.get_empty_count() > 0 and not board.gameover:
+                    pos = board.get_random_empty_square()
+                    other = bitboard.clone()
+                    bitboard.push(pos, player)
+                    self.assertTrue(other.is_empty_pos(pos))
+                    board.push(pos, player)
+                    self.assertEqual(bitboard.is_win(pos, player), board.is_win(pos, player))
+                    self.assertFalse(bitboard.is_win(pos, 3 - player))
+                    self.assertEqual(bitboard.gameover, board.gameover)
+                    self.assertEqual(bitboard.get_empty_squares(), board.get_empty_squares())
+                    self.assertEqual(bitboard.get_empty_count(), board.get_empty_count())
+                    self.assertEqual(bitboard.cells, board.cells)
+                    player = 3 - player
+                self.assertEqual(bitboard.is_tie(), board.is_tie())
+                self.assertTrue((BitBoard(size, k, board=board.board).board == board.board).all())
+                self.assertEqual(BitBoard.from_board(board).masks, bitboard.masks)
+                bitboard.pop_to(0)
+                self.assertEqual(bitboard.masks, [0, 0, 0])
+                self.assertFalse(bitboard.gameover)
+
+    def test_diagonals(self):
+        board = Board((3, 4), 3, board=[[1, 0, 2, 0], [0, 1, 0, 2], [2, 0, 1, 0]])
+        self.assertEqual(board.get_diagonal_topleft(1, 1), [1, 1, 1])
+        self.assertEqual(board.get_diagonal_topleft(0, 2), [2, 2])
+        self.assertEqual(board.get_diagonal_topright(1, 1), [2, 1, 2])
+        self.assertEqual(board.get_diagonal_topright(2, 3), [0])
 
 
 if __name__ == '__main__':
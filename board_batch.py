@@ -0,0 +1,214 @@
+#!/usr/bin/python3
+
+# AI 531 - m,n,k
+# Wadood Alam
+# Joe Nguyen
+# Matthew Pacey
+
+import unittest
+from typing import Tuple
+
+import numpy as np
+
+from board import Board, get_geometry
+
+"""
+Many boards of the same m,n,k held as one (N, m, n) int8 array so moves, empty cell sampling and win
+detection run as a few NumPy calls over the whole batch instead of one Python loop per board
+Intended for simulation heavy work (e.g. running hundreds of random playouts at once)
+"""
+
+
+class BoardBatch:
+    def __init__(self, n_boards: int, size: Tuple[int, int], k: int, boards=None):
+        """
+        :param n_boards: number of boards in the batch
+        :param size: (m, n) of every board
+        :param k: number of consecutive cells to win
+        :param boards: optional (n_boards, m, n) array of starting positions (0 empty, 1 X, 2 O)
+        """
+        self.size = size
+        self.k = k
+        self.geometry = get_geometry(size, k)
+        if boards is not None:
+            self.boards = np.array(boards, dtype=np.int8, order='C').reshape((n_boards,) + tuple(size))
+        else:
+            self.boards = np.zeros((n_boards,) + tuple(size), dtype=np.int8)
+        self.cells = self.boards.reshape(n_boards, -1)      # flat view, indexed [board, pos]
+        self.windows = np.array(self.geometry.windows, dtype=np.intp).reshape(-1, k)     # (n_windows, k) cell ids
+        self.winner = np.zeros(n_boards, dtype=np.int8)
+        self.gameover = np.zeros(n_boards, dtype=bool)
+        self.update_gameover()
+
+    def __len__(self):
+        return self.boards.shape[0]
+
+    @classmethod
+    def from_boards(cls, boards):
+        """
+        Stack a list of board.Board objects (all the same size and k) into a batch
+        :param boards:
+        :return:
+        """
+        size, k = boards[0].size, boards[0].k
+        assert all(board.size == size and board.k == k for board in boards)
+        return cls(len(boards), size, k, np.stack([board.board for board in boards]))
+
+    def to_board(self, i: int):
+        """
+        Copy board i of the batch into a board.Board
+        :param i:
+        :return:
+        """
+        board = Board(self.size, self.k, board=self.boards[i].astype(int))
+        board.gameover = bool(self.gameover[i])
+        board.winner = int(self.winner[i])
+        return board
+
+    def to_boards(self):
+        return [self.to_board(i) for i in range(len(self))]
+
+    def get_empty_counts(self):
+        """
+        :return: number of empty cells on each board
+        """
+        return np.count_nonzero(self.cells == 0, axis=1)
+
+    def get_random_empty_squares(self, rng=None):
+        """
+        Pick one empty cell uniformly at random on every board
+        :param rng: numpy Generator (default: a fresh one)
+        :return: array of cell ids, -1 for boards without an empty cell
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        empty = self.cells == 0
+        # random key for every empty cell, -1 for filled ones; the largest key is a uniform pick of the empties
+        keys = np.where(empty, rng.random(empty.shape), -1.)
+        positions = keys.argmax(axis=1)
+        positions[~empty.any(axis=1)] = -1
+        return positions
+
+    def make_moves(self, positions, players):
+        """
+        Make one move on every board; boards with a position of -1 are left alone
+        Gameover and winner are updated for every board that changed
+        :param positions: cell id per board (or -1)
+        :param players: player per board (or a single player for all boards)
+        """
+        positions = np.asarray(positions)
+        players = np.broadcast_to(np.asarray(players, dtype=np.int8), positions.shape)
+        moved = positions >= 0
+        rows = np.nonzero(moved)[0]
+        assert (self.cells[rows, positions[moved]] == 0).all(), 'Cell already taken'
+        self.cells[rows, positions[moved]] = players[moved]
+        self.update_gameover(moved)
+
+    def get_winners(self, mask=None):
+        """
+        Batch win detection: sum each player's stones over every k-window of every board
+        :param mask: optional bool array selecting which boards to check
+        :return: winner per checked board (0 if nobody has k in a row)
+        """
+        cells = self.cells if mask is None else self.cells[mask]
+        window_cells = cells[:, self.windows]        # (boards, n_windows, k)
+        winners = np.zeros(cells.shape[0], dtype=np.int8)
+        for player in [1, 2]:
+            won = ((window_cells == player).sum(axis=2) == self.k).any(axis=1)
+            winners[won & (winners == 0)] = player
+        return winners
+
+    def update_gameover(self, mask=None):
+        """
+        Recompute winner and gameover for the boards in mask (all boards if None)
+        :param mask:
+        """
+        if mask is None:
+            mask = np.ones(len(self), dtype=bool)
+        mask = mask & ~self.gameover
+        if not mask.any():
+            return
+        winners = self.get_winners(mask)
+        self.winner[mask] = winners
+        full = np.count_nonzero(self.cells[mask] == 0, axis=1) == 0
+        self.gameover[mask] = (winners != 0) | full
+
+    def play_random(self, players, rng=None):
+        """
+        Play uniformly random moves on every board until all of them are over
+        :param players: player to move on each board (or a single player for all boards)
+        :param rng: numpy Generator (default: a fresh one)
+        :return: winner of each board (0 for a tie)
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        players = np.array(np.broadcast_to(np.asarray(players, dtype=np.int8), (len(self),)))
+        while not self.gameover.all():
+            positions = self.get_random_empty_squares(rng)
+            positions[self.gameover] = -1
+            self.make_moves(positions, players)
+            players = 3 - players     # alternate between player 1 and 2
+        return self.winner.copy()
+
+
+class TestBoardBatch(unittest.TestCase):
+    def test_round_trip(self):
+        """
+        Boards survive conversion to a batch and back, including gameover and winner
+        """
+        first = Board((4, 3), 3)
+        first.make_move(2, 1)
+        second = Board((4, 3), 3)
+        for pos in [0, 4, 8]:
+            second.make_move(pos, 2)
+        second.is_win(8, 2)
+
+        batch = BoardBatch.from_boards([first, second])
+        self.assertEqual(batch.boards.shape, (2, 4, 3))
+        self.assertEqual(list(batch.winner), [0, 2])
+        self.assertEqual(list(batch.gameover), [False, True])
+        self.assertEqual(list(batch.get_empty_counts()), [11, 9])
+
+        boards = batch.to_boards()
+        self.assertEqual(boards[0].get_empty_squares(), first.get_empty_squares())
+        self.assertTrue((boards[1].board == second.board).all())
+        self.assertEqual(boards[1].winner, 2)
+        self.assertTrue(boards[1].gameover)
+
+    def test_make_moves(self):
+        batch = BoardBatch(3, (3, 3), 3)
+        batch.make_moves([0, 4, -1], [1, 2, 1])
+        batch.make_moves([1, 5, -1], 1)
+        self.assertEqual(list(batch.cells[0][:3]), [1, 1, 0])
+        self.assertEqual(batch.cells[1][4], 2)
+        self.assertEqual(list(batch.get_empty_counts()), [7, 7, 9])
+        batch.make_moves([2, -1, -1], 1)
+        self.assertEqual(list(batch.winner), [1, 0, 0])
+        self.assertEqual(list(batch.gameover), [True, False, False])
+
+    def test_random_empty_squares(self):
+        batch = BoardBatch(200, (3, 3), 3)
+        batch.make_moves(np.full(200, 4), 1)
+        positions = batch.get_random_empty_squares(np.random.default_rng(531))
+        self.assertNotIn(4, positions)
+        self.assertEqual(set(positions), {0, 1, 2, 3, 5, 6, 7, 8})
+
+        full = BoardBatch(1, (1, 2), 2, [[[1, 2]]])
+        self.assertEqual(list(full.get_random_empty_squares()), [-1])
+
+    def test_play_random(self):
+        """
+        Every random game ends with a winner that matches Board.is_win or a full board
+        """
+        batch = BoardBatch(100, (4, 4), 3)
+        winners = batch.play_random(1, np.random.default_rng(531))
+        self.assertTrue(batch.gameover.all())
+        for i, board in enumerate(batch.to_boards()):
+            has_win = {player: any(board.count_run(pos, player) >= 3 for pos in range(16)) for player in [1, 2]}
+            if winners[i] == 0:
+                self.assertEqual(board.get_empty_count(), 0)
+                self.assertFalse(has_win[1] or has_win[2])
+            else:
+                self.assertTrue(has_win[winners[i]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -16,9 +16,28 @@ max_mcts_loops = 500               # number of times to run mcts at each eval
 # dial for which node is expanded; if random number between 0 and 1 is greater than this, random node
 # will be generated; else best node will be expanded using policy
 expand_random_chance = 0.9  # favor policy 90% of the time, 10% random
+playout_backend = 'bitboard'        # board the random playouts run on: 'bitboard' (board.BitBoard) or 'array' (board.Board)
 DEBUG = False                       # set to True for verbose debugging messages
 show_each_move = False
 
+tt_size = 2 ** 18                   # alpha-beta transposition table slots
+tt_replacement = 'depth'            # transposition table replacement policy: 'depth' (deepest kept) or 'always'
+ab_workers = 1                      # processes for the alpha-beta root search (1: search in this process)
+
+candidate_radius = 2                # only consider empty squares this close to a stone (None: every square)...
+candidate_min_cells = 49            # ...on boards with at least this many cells (7x7 and up)
+
+opening_book_dir = 'data'           # opening books (opening_book.build_book) are read from here (None: no book)
+
+pn_node_budget = 10 ** 6            # proof number search: nodes per solve before giving up (None: no limit)
+pn_max_entries = 2 ** 21            # proof number search: transposition table entries before giving up
+
+endgame_empties = 6                 # with at most this many empty squares left (and at most a third of the board)
+                                    # both engines play the endgame solver move (0: off)
+endgame_max_entries = 2 ** 21       # endgame solver memo entries before the memo is emptied
+
+threat_search_depth = 9            # plies of forcing threats searched for a forced win before each move (0: off)
+
 data_collection_loops = 100         # default number of loops for each data collection test
 
 
@@ -22,10 +22,15 @@ class MNKDataCollection(unittest.TestCase):
 
     def setUp(self):
         '''
-        Reset some of the mcts constants
+        Reset some of the mcts constants; the endgame solver is off so the bots themselves are compared
         :return:
         '''
         cfg.reset()
+        self.endgame_empties = cfg.endgame_empties
+        cfg.endgame_empties = 0
+
+    def tearDown(self):
+        cfg.endgame_empties = self.endgame_empties
 
     def test_mcts_consts(self):
         '''
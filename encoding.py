@@ -0,0 +1,222 @@
+#!/usr/bin/python3
+
+# AI 531 - m,n,k
+# Wadood Alam
+# Joe Nguyen
+# Matthew Pacey
+
+import unittest
+from typing import List, Tuple
+
+import numpy as np
+
+from board import Board
+from util import get_other_player
+
+"""
+Compact binary encodings for storing many positions and games (caches, opening books, replays)
+
+Position: 3 byte header (m, n, k) followed by the cells packed 2 bits each (0 empty, 1 X, 2 O), four cells per
+byte with the lowest cell id in the lowest bits. A 7x7 position is 3 + 13 = 16 bytes
+Game: 3 byte header (m, n, k), the number of moves, then each move's cell id, all as varints (7 bits per byte,
+high bit set on every byte but the last). Player 1 always moves first
+"""
+
+HEADER_SIZE = 3
+
+
+def get_record_size(size: Tuple[int, int]):
+    """
+    Number of bytes of an encoded position for the given board size
+    :param size:
+    :return:
+    """
+    return HEADER_SIZE + (size[0] * size[1] + 3) // 4
+
+
+def encode_array(boards, k: int):
+    """
+    Bulk encode positions
+    :param boards: (N, m, n) array of cells (0 empty, 1 X, 2 O)
+    :param k: number of consecutive cells to win
+    :return: (N, record size) uint8 array, one encoded position per row (row.tobytes() is one record)
+    """
+    boards = np.asarray(boards, dtype=np.uint8)
+    n_boards, rows, cols = boards.shape
+    cells = boards.reshape(n_boards, -1)
+    padding = -cells.shape[1] % 4
+    if padding:
+        cells = np.concatenate([cells, np.zeros((n_boards, padding), dtype=np.uint8)], axis=1)
+    quads = cells.reshape(n_boards, -1, 4)
+    packed = quads[:, :, 0] | (quads[:, :, 1] << 2) | (quads[:, :, 2] << 4) | (quads[:, :, 3] << 6)
+
+    header = np.tile(np.array([rows, cols, k], dtype=np.uint8), (n_boards, 1))
+    return np.concatenate([header, packed], axis=1)
+
+
+def decode_array(records):
+    """
+    Bulk decode positions encoded by encode_array (all records must have the same header)
+    :param records: (N, record size) uint8 array, or the concatenated records as bytes
+    :return: (N, m, n) int8 array of cells and k
+    """
+    if isinstance(records, (bytes, bytearray, memoryview)):
+        header = np.frombuffer(records, dtype=np.uint8, count=HEADER_SIZE)
+        records = np.frombuffer(records, dtype=np.uint8).reshape(-1, get_record_size((int(header[0]), int(header[1]))))
+    records = np.asarray(records, dtype=np.uint8)
+    rows, cols, k = (int(v) for v in records[0, :HEADER_SIZE])
+    assert (records[:, :HEADER_SIZE] == records[0, :HEADER_SIZE]).all(), 'Mixed board sizes'
+
+    packed = records[:, HEADER_SIZE:]
+    cells = np.stack([(packed >> shift) & 3 for shift in [0, 2, 4, 6]], axis=2).reshape(len(records), -1)
+    return cells[:, :rows * cols].reshape(len(records), rows, cols).astype(np.int8), k
+
+
+def encode_position(board: Board):
+    """
+    :param board:
+    :return: encoded position (bytes)
+    """
+    return encode_array(board.board[np.newaxis], board.k)[0].tobytes()
+
+
+def decode_position(data: bytes):
+    """
+    :param data: position encoded by encode_position
+    :return: Board (gameover/winner are not part of the encoding and start cleared)
+    """
+    cells, k = decode_array(np.frombuffer(data, dtype=np.uint8)[np.newaxis])
+    return Board(cells.shape[1:], k, board=cells[0])
+
+
+def encode_varint(value: int, out: bytearray):
+    # append value as an unsigned varint
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(data, offset: int):
+    """
+    :param data:
+    :param offset: position of the first byte of the varint
+    :return: value and offset of the byte after it
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def encode_game(size: Tuple[int, int], k: int, moves: List[int]):
+    """
+    :param size: (m, n)
+    :param k:
+    :param moves: cell id of every move in order, player 1 first
+    :return: encoded game (bytes)
+    """
+    out = bytearray([size[0], size[1], k])
+    encode_varint(len(moves), out)
+    for move in moves:
+        encode_varint(int(move), out)
+    return bytes(out)
+
+
+def decode_game(data, offset: int = 0):
+    """
+    :param data: one or more encoded games back to back
+    :param offset: where the game to decode starts
+    :return: (m, n), k, list of moves and the offset of the next game
+    """
+    size = (data[offset], data[offset + 1])
+    k = data[offset + 2]
+    n_moves, offset = decode_varint(data, offset + HEADER_SIZE)
+    moves = []
+    for _ in range(n_moves):
+        move, offset = decode_varint(data, offset)
+        moves.append(move)
+    return size, k, moves, offset
+
+
+def iter_games(data):
+    """
+    Iterate the games of a buffer of back to back encoded games
+    :param data:
+    :return: generator of ((m, n), k, moves)
+    """
+    offset = 0
+    while offset < len(data):
+        size, k, moves, offset = decode_game(data, offset)
+        yield size, k, moves
+
+
+def replay_game(size: Tuple[int, int], k: int, moves: List[int]):
+    """
+    Play the moves of a decoded game onto a new board (with push, so they can be undone)
+    :param size:
+    :param k:
+    :param moves:
+    :return: Board at the end of the game
+    """
+    board = Board(size, k)
+    player = 1
+    for move in moves:
+        board.push(move, player)
+        board.is_win(move, player)
+        player = get_other_player(player)
+    return board
+
+
+class TestEncoding(unittest.TestCase):
+    def test_position_round_trip(self):
+        for size in [(3, 3), (4, 5), (7, 7)]:
+            board = Board(size, 3)
+            for i, pos in enumerate(range(0, size[0] * size[1], 3)):
+                board.make_move(pos, 1 + i % 2)
+            data = encode_position(board)
+            self.assertEqual(len(data), get_record_size(size))
+            decoded = decode_position(data)
+            self.assertEqual(decoded.size, size)
+            self.assertEqual(decoded.k, 3)
+            self.assertTrue((decoded.board == board.board).all())
+            self.assertEqual(decoded.zobrist, board.zobrist)
+
+        self.assertEqual(encode_position(Board((2, 2), 2, board=[[1, 2], [0, 1]])), bytes([2, 2, 2, 0b01001001]))
+
+    def test_bulk_round_trip(self):
+        rng = np.random.default_rng(531)
+        boards = rng.integers(0, 3, size=(1000, 5, 6), dtype=np.int8)
+        records = encode_array(boards, 4)
+        self.assertEqual(records.shape, (1000, get_record_size((5, 6))))
+        cells, k = decode_array(records)
+        self.assertEqual(k, 4)
+        self.assertTrue((cells == boards).all())
+        cells, k = decode_array(records.tobytes())
+        self.assertTrue((cells == boards).all())
+
+        boards = rng.integers(0, 3, size=(10, 16, 17), dtype=np.int8)     # m * n above 255
+        cells, k = decode_array(encode_array(boards, 5).tobytes())
+        self.assertEqual(k, 5)
+        self.assertTrue((cells == boards).all())
+
+    def test_game_round_trip(self):
+        games = [((3, 3), 3, [4, 0, 8, 2, 1, 7, 6, 3, 5]),
+                 ((12, 12), 5, [0, 143, 127, 128, 129]),     # cell ids above 127 take 2 bytes
+                 ((4, 4), 3, [])]
+        data = b''.join(encode_game(size, k, moves) for size, k, moves in games)
+        self.assertEqual(len(encode_game(*games[0])), 3 + 1 + 9)
+        self.assertEqual(list(iter_games(data)), games)
+
+        board = replay_game(*games[0])
+        self.assertTrue(board.is_tie())
+        self.assertEqual(len(board.history), 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+#!/usr/bin/python3
+
+# AI 531 - m,n,k
+# Wadood Alam
+# Joe Nguyen
+# Matthew Pacey
+
+import unittest
+
+from board import Board
+from transposition import get_key
+from util import get_other_player, log
+
+import cfg
+
+"""
+Exact endgame solver: once few empty squares are left, the whole remaining game tree is small enough to search
+to the end. The engines hand off to it (see use_endgame_solver) instead of running playouts or depth limited
+searches, so their late game moves are perfect
+
+Solved positions are memoized by transposition table key (canonical zobrist hash and player to move), so
+transpositions and symmetric positions are solved once and later moves of the same game mostly hit the table
+"""
+
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+tables = {}     # (m, n, k) -> {key: (value, canonical move)}, kept between moves and games
+
+
+def get_table(board: Board):
+    """
+    :return: memo of solved positions for the board's m,n,k (emptied when it grows past cfg.endgame_max_entries)
+    """
+    size = (board.size[0], board.size[1], board.k)
+    table = tables.get(size)
+    if table is None or len(table) > cfg.endgame_max_entries:
+        table = tables[size] = {}
+    return table
+
+
+def use_endgame_solver(board: Board):
+    """
+    :return: True if few enough empty squares are left to hand the move off to the solver: at most
+    cfg.endgame_empties, and at most a third of the board so the engines still play most of a small board game
+    """
+    return board.get_empty_count() <= min(cfg.endgame_empties, board.geometry.n_cells // 3)
+
+
+def search(board: Board, player, table: dict):
+    """
+    Value of the position for player (to move) with perfect play, and a best move
+    A position never arises from a winning move: a mover with a winning square takes it right away
+    :param board: left unchanged
+    :param player:
+    :param table: memo, see get_table
+    :return: WIN, DRAW or LOSS and the best move in the canonical frame of the position (None if the game is over)
+    """
+    wins = board.winning_squares[player]
+    if wins:
+        return WIN, board.geometry.symmetries[board.get_canonical_symmetry()][min(wins)]
+    if board.get_empty_count() == 0:
+        return DRAW, None
+
+    key = get_key(board, player)
+    entry = table.get(key)
+    if entry is not None:
+        return entry
+
+    other = get_other_player(player)
+    blocks = board.winning_squares[other]
+    # a threat has to be blocked, and two threats can't be
+    moves = [min(blocks)] if blocks else list(board.iter_empty_squares())     # copied: push/pop reorder it
+    best, best_move = LOSS - 1, None
+    for move in moves:
+        board.push(move, player)
+        value = -search(board, other, table)[0]
+        board.pop()
+        if value > best:
+            best, best_move = value, move
+            if best == WIN:     # nothing beats a win, the value is exact without searching the other moves
+                break
+
+    entry = table[key] = (best, board.geometry.symmetries[board.get_canonical_symmetry()][best_move])
+    return entry
+
+
+def solve(board: Board, player):
+    """
+    :param board:
+    :param player: player to move
+    :return: WIN, DRAW or LOSS for player and a move that achieves it (None if the game is over)
+    """
+    value, move = search(board, player, get_table(board))
+    if move is not None:
+        move = board.geometry.inverse_symmetries[board.get_canonical_symmetry()][move]
+    return value, move
+
+
+def get_endgame_move(board: Board, player):
+    """
+    Perfect move from the endgame solver, if the board has few enough empty squares
+    :param board:
+    :param player: player to move
+    :return: move or None
+    """
+    if not use_endgame_solver(board):
+        return None
+    value, move = solve(board, player)
+    log(f'Endgame solver move for player {player}: {move} ({value=})')
+    return move
+
+
+class TestEndgame(unittest.TestCase):
+    def test_solve(self):
+        board = Board((3, 3), 3)
+        self.assertEqual(solve(board, 1)[0], DRAW)
+        board.make_move(0, 1)
+        board.make_move(1, 2)       # an edge reply to a corner loses
+        value, move = solve(board, 1)
+        self.assertEqual(value, WIN)
+        board.make_move(move, 1)
+        self.assertEqual(solve(board, 2)[0], LOSS)
+        self.assertEqual(len(board.history), 0)     # board left as it was
+
+        # the same position mirrored is answered from the memo with the mirrored move
+        board = Board((3, 3), 3)
+        for pos, player in [(0, 1), (4, 2), (8, 1), (2, 2)]:
+            board.make_move(pos, player)
+        value, move = solve(board, 1)
+        self.assertEqual((value, move), (WIN, 6))   # the only block, which makes two threats
+        mirrored = Board((3, 3), 3)
+        for pos, player in [(2, 1), (4, 2), (6, 1), (0, 2)]:
+            mirrored.make_move(pos, player)
+        entries = len(get_table(mirrored))
+        self.assertEqual(solve(mirrored, 1), (WIN, 8))
+        self.assertEqual(len(get_table(mirrored)), entries)
+
+    def test_threshold(self):
+        board = Board((3, 3), 3)
+        for pos in range(5):
+            board.make_move(pos, 1 + pos % 2)
+        self.assertFalse(use_endgame_solver(board))     # 4 empty squares: more than a third of the board
+        board.make_move(5, 2)
+        self.assertTrue(use_endgame_solver(board))
+        board = Board((5, 5), 4)
+        for pos in range(18):
+            board.make_move(pos, 1 + pos % 2)
+        self.assertEqual(use_endgame_solver(board), cfg.endgame_empties >= 7)
+
+    def test_agrees_with_proof_number_search(self):
+        import random
+        import proof_number
+        cases = [((4, 4), 3), ((3, 5), 4), ((4, 4), 4)]
+        for board, player in proof_number.get_random_positions(random.Random(531), cases, 4, (5, 8)):
+            value, move = solve(board, player)
+            self.assertEqual(value, proof_number.solve(board, player)[0])
+            if value != LOSS:       # the move keeps the value
+                board.push(move, player)
+                if not board.is_win(move, player):
+                    self.assertEqual(solve(board, get_other_player(player))[0], -value)
+                board.pop()
+
+
+if __name__ == '__main__':
+    unittest.main()
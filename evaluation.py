@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+
+# AI 531 - m,n,k
+# Wadood Alam
+# Joe Nguyen
+# Matthew Pacey
+
+import unittest
+
+import numpy as np
+
+from board import Board, get_geometry
+
+"""
+Static evaluation of positions that are not over, for the leaves of a depth limited search
+Every k-window that still only holds stones of one player is a possible win for that player, worth more the
+more stones it holds (WINDOW_BASE ** stones). Windows holding stones of both players are dead and worth nothing.
+The difference between the players is squashed into (-1, 1), so any proven win or loss still outranks it
+
+Evaluators take (board, player) and return the value for player; all of them return the same values
+"""
+
+WINDOW_BASE = 4
+score_tables = {}   # k -> (k + 1, k + 1) array of window scores for player 1, indexed [X stones, O stones]
+window_arrays = {}  # (size, k) -> (n_windows, k) array of window cell ids
+
+
+def get_score_table(k: int):
+    """
+    :param k:
+    :return: table[x, o] = score of a window with x X stones and o O stones, for player 1
+    """
+    if k not in score_tables:
+        table = np.zeros((k + 1, k + 1), dtype=np.int64)
+        for stones in range(1, k + 1):
+            table[stones, 0] = WINDOW_BASE ** stones - 1
+            table[0, stones] = -(WINDOW_BASE ** stones - 1)
+        score_tables[k] = table
+    return score_tables[k]
+
+
+def squash(raw, k: int):
+    # map raw window score sums onto (-1, 1); a single window one stone short of k scores 0.5
+    scale = WINDOW_BASE ** (k - 1) - 1
+    return raw / (np.abs(raw) + max(scale, 1))
+
+
+def evaluate_cells(cells, windows, k: int):
+    """
+    Vectorized evaluation of many positions at once (e.g. a BoardBatch)
+    :param cells: (N, m * n) array of cells (0 empty, 1 X, 2 O)
+    :param windows: (n_windows, k) array of the cell ids of every window
+    :param k:
+    :return: value of each position for player 1, in (-1, 1)
+    """
+    window_cells = np.asarray(cells)[:, windows]
+    x_stones = (window_cells == 1).sum(axis=2)
+    o_stones = (window_cells == 2).sum(axis=2)
+    raw = get_score_table(k)[x_stones, o_stones].sum(axis=1)
+    return squash(raw, k)
+
+
+def evaluate_array(board: Board, player):
+    """
+    Evaluate from the board array
+    :param board:
+    :param player:
+    :return: value for player, in (-1, 1)
+    """
+    key = (board.size, board.k)
+    if key not in window_arrays:
+        window_arrays[key] = np.array(get_geometry(*key).windows, dtype=np.intp).reshape(-1, board.k)
+    value = float(evaluate_cells(board.board.reshape(1, -1), window_arrays[key], board.k)[0])
+    return value if player == 1 else -value
+
+
+def evaluate_windows(board: Board, player):
+    """
+    Evaluate from the window stone counts Board keeps up to date (no pass over the cells)
+    :param board:
+    :param player:
+    :return: value for player, in (-1, 1)
+    """
+    table = get_score_table(board.k)
+    x_stones = np.array(board.window_counts[1], dtype=np.intp)
+    o_stones = np.array(board.window_counts[2], dtype=np.intp)
+    value = float(squash(int(table[x_stones, o_stones].sum()), board.k))
+    return value if player == 1 else -value
+
+
+class TestEvaluation(unittest.TestCase):
+    def test_evaluate(self):
+        board = Board((4, 4), 3)
+        self.assertEqual(evaluate_windows(board, 1), 0)
+        board.make_move(5, 1)
+        center = evaluate_windows(board, 1)
+        self.assertGreater(center, 0)
+        self.assertEqual(evaluate_windows(board, 2), -center)
+
+        corner = Board((4, 4), 3)
+        corner.make_move(0, 1)
+        self.assertLess(evaluate_windows(corner, 1), center)    # fewer windows through a corner
+
+        board.make_move(6, 1)
+        board.make_move(10, 2)
+        self.assertGreater(evaluate_windows(board, 1), center)
+        self.assertLess(evaluate_windows(board, 1), 1)
+
+    def test_evaluators_agree(self):
+        rng = np.random.default_rng(531)
+        cells = rng.integers(0, 3, size=(50, 5 * 6), dtype=np.int8)
+        geometry = get_geometry((5, 6), 4)
+        values = evaluate_cells(cells, np.array(geometry.windows).reshape(-1, 4), 4)
+        for i in range(len(cells)):
+            board = Board((5, 6), 4, board=cells[i].reshape(5, 6))
+            self.assertAlmostEqual(evaluate_windows(board, 1), values[i])
+            self.assertAlmostEqual(evaluate_array(board, 2), -values[i])
+
+
+if __name__ == '__main__':
+    unittest.main()
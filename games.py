@@ -9,8 +9,9 @@ from collections import defaultdict
 
 from tqdm import tqdm
 
-from mcts import mcts_new
+from mcts import MCTS, mcts_new
 from alphaBeta import *
+import alphaBeta
 
 import cfg
 
@@ -39,16 +40,33 @@ def time_selected_move(move_func, board, player):
     return best_move, runtime
 
 
-def bot_vs_bot(p1_func, p2_func, n_games: int, m: int, n: int, k: int, filename=None, player_mcts_loops=None):
+def get_bot_name(move_func):
+    """
+    :param move_func: move decision function of bot_vs_bot
+    :return: name of the algorithm for the results file
+    """
+    if move_func == mcts_new:
+        return 'mcts'
+    if isinstance(move_func, MCTS):
+        return 'mcts_reuse' if move_func.reuse else 'mcts'
+    if move_func == negamax_bot:
+        return 'negamax'
+    return 'ab'
+
+
+def bot_vs_bot(p1_func, p2_func, n_games: int, m: int, n: int, k: int, filename=None, player_mcts_loops=None,
+               stats=None):
     '''
     Simulate n games of p1_func vs. p2_func using m by n board (k consecutive to win)
     p*_func will be either the mcts algo or the alpha beta algo
-    :param p1_func: player1 move decision function (mcts or ab)
-    :param p2_func: player2 move decision function (mcts or ab)
+    :param p1_func: player1 move decision function (mcts or ab); an MCTS instance keeps its tree between moves
+    :param p2_func: player2 move decision function (mcts or ab), not the same MCTS instance as p1_func
     :param n_games: number of games to simulate
     :param m: board dimension
     :param n: board dimension
     :param k: number of consecutive cells to win
+    :param stats: optional dict player -> SearchStats; the stats of every alpha-beta search of the player are
+    merged into it
     :return: winning percentage of each player, tie percent and average runtime per player for each move
     '''
     '''
@@ -74,10 +92,13 @@ def bot_vs_bot(p1_func, p2_func, n_games: int, m: int, n: int, k: int, filename=
     # for n_game in range(n_games):
         player = 1
         board = Board((m, n), k)
-        while len(board.get_empty_squares()) > 0:
+        while board.get_empty_count() > 0:
             if player_mcts_loops:  # allow for different mcts loop values per player
                 cfg.max_mcts_loops = player_mcts_loops[player]
+            alphaBeta.last_stats = None
             best_move, runtime = time_selected_move(move_funcs[player], board, player)
+            if stats is not None and alphaBeta.last_stats is not None:
+                stats[player].merge(alphaBeta.last_stats)
             runtimes[player] += runtime
             moves[player] += 1
             board.make_move(best_move, player)
@@ -107,14 +128,8 @@ def bot_vs_bot(p1_func, p2_func, n_games: int, m: int, n: int, k: int, filename=
     p2_avg_time = runtimes[2] / moves[2]
 
     if filename:
-        if p1_func == mcts_new:
-            p1 = 'mcts'
-        else:
-            p1 = 'ab'
-        if p2_func == mcts_new:
-            p2 = 'mcts'
-        else:
-            p2 = 'ab'
+        p1 = get_bot_name(p1_func)
+        p2 = get_bot_name(p2_func)
         with open(filename, 'a') as csv:  # append to file as sim progresses
             line = ','.join([str(val) for val in [m, n, k, p1, p2, p1_win_pct, p2_win_pct, tie_pct, n_games, f'{p1_avg_time:.4f}', f'{p2_avg_time:.4f}']])
 
@@ -145,7 +160,7 @@ def mcts_vs_mcts(n_games: int, m: int, n: int, k: int):
     for n_game in tqdm(range(n_games)):
         player = 1
         board = Board((m, n), k)
-        while len(board.get_empty_squares()) > 0:
+        while board.get_empty_count() > 0:
             best_move, runtime = time_selected_move(mcts_new, board, player)  # mcts_new(board, player)
             runtimes[player] += runtime
             moves[player] += 1
@@ -191,7 +206,7 @@ def ab_vs_ab(n_games: int, m: int, n: int, k: int):
     for n_game in tqdm(range(n_games)):
         player = 1
         board = Board((m, n), k)
-        while len(board.get_empty_squares()) > 0:
+        while board.get_empty_count() > 0:
             best_move = bot_move(board, player, 'ab')
             board.make_move(best_move, player)
             if board.is_win(best_move, player):
@@ -229,7 +244,7 @@ def mcts_vs_ab(n_games: int, m: int, n: int, k: int):
     for n_game in tqdm(range(n_games)):
         player = 1
         board = Board((m, n), k)
-        while len(board.get_empty_squares()) > 0:
+        while board.get_empty_count() > 0:
             if player == 1:  # player 1 uses mcts to pick move
                 best_move = mcts_new(board, player)
             else:  # player 2 uses ab to pick move
@@ -272,7 +287,7 @@ def ab_vs_mcts(n_games: int, m: int, n: int, k: int):
     for n_game in tqdm(range(n_games)):
         player = 1
         board = Board((m, n), k)
-        while len(board.get_empty_squares()) > 0:
+        while board.get_empty_count() > 0:
             if player == 1:  # player 1 uses ab to pick move
                 best_move = ab_bot(board, player)
             else:  # player 2 uses mcts to pick move
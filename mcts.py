@@ -9,10 +9,11 @@ import math
 import random
 import unittest
 
-from copy import deepcopy
-
-from board import Board
-from util import get_other_player, log
+from board import Board, BitBoard, ARRAY_BACKEND, BITBOARD_BACKEND
+from opening_book import get_book_move
+from endgame import get_endgame_move
+from threat_search import find_forced_win
+from util import get_candidate_squares, get_other_player, log
 
 import cfg
 
@@ -21,18 +22,23 @@ DEBUG = cfg.DEBUG  # set to True for verbose debugging messages
 
 class Node:
     """
-    Node for tree search. Maintain parent, children, baard state and move to get to this node
+    Node for tree search. Maintain parent, children and move to get to this node
     Maintain the number of wins and games for each node (propagates up tree after simulation)
+    The player of a node is the player who took its square (the root: the player who moved last)
+    Nodes do not hold a board: the search pushes the squares along the path from the root onto a single
+    board while descending and pops them off again after each loop
     """
 
-    def __init__(self, board, player, parent=None, square=None):
-        self.board = deepcopy(board)  # ensure any edits made to the board do not bubble up
+    def __init__(self, player, parent=None, square=None):
         self.player = player
         self.parent = parent
         self.square = square
         self.children = []
         self.wins = 0
         self.games = 0
+        self.untried = None             # squares not expanded into children yet (None: not listed yet)
+        self.threats_searched = False   # forced_win is only searched once per node
+        self.forced_win = None
 
     def get_uct(self):
         """
@@ -41,8 +47,8 @@ class Node:
         uct = wins / games + C * sqrt(log(Parent games)/ (this node games))
         :return:
         """
-        if self.games == 0:  # avoid divide by zero
-            return 0
+        if self.games == 0:  # avoid divide by zero; every child is simulated once before uct values are compared
+            return math.inf
 
         if not self.parent:  # return raw win percentage for root node
             return self.wins / self.games
@@ -55,59 +61,155 @@ class Node:
         return value
 
 
-def mcts_new(board: Board, player):
+class MCTS:
     """
-    Main Monte Carlo Tree Search algo
-    :param board:
-    :param player:
-    :return: best move given current board
+    Monte Carlo Tree Search that keeps its tree between moves. Levels of the tree alternate between the players:
+    the children of the root are the moves of the player to move, their children the replies. When called again
+    after its own move and the opponent's reply, the search starts from the grandchild of the old root for that
+    pair of moves, with the games and wins already simulated below it
+    An instance is a move function (same interface as mcts_new) for one player; use one instance per player
     """
-    loops = 0
-    root = Node(board, player, None, None)
-
-    # initialize children as every possible empty square at root node
-    for square in board.get_empty_squares():
-        node = Node(board, player, root, square)
-        root.children.append(node)
 
-    log('\nNEW MCTS RUN')
-
-    while loops < cfg.max_mcts_loops:
-        loops += 1
+    def __init__(self, reuse: bool = True):
+        """
+        :param reuse: keep the tree between moves (False: fresh tree every move, like mcts_new)
+        """
+        self.reuse = reuse
+        self.root = None
+        self.cells = None       # board cells the root was searched on
+        self.game = None        # (size, k) of the board the root was searched on
+        self.reused_games = 0   # simulated games inherited from previous moves, over all searches
 
-        # selection
-        node = select_node(root)
+    def __call__(self, board: Board, player):
+        return self.get_move(board, player)
 
-        # expansion
-        leaf = expand_node(node)
+    def find_subtree(self, board: Board, player):
+        """
+        :param board:
+        :param player: player to move
+        :return: the node of the kept tree for board, or None if board is not the root position followed by a move
+        of player and a reply (e.g. a new game) or the tree never expanded those moves
+        """
+        if not self.reuse or self.root is None or self.game != (board.size, board.k):
+            return None
+        played = [pos for pos, (old, new) in enumerate(zip(self.cells, board.cells)) if old != new]
+        if len(played) != 2 or any(self.cells[pos] != 0 for pos in played):
+            return None
+        other = get_other_player(player)
+        moves = sorted(played, key=lambda pos: board.cells[pos] != player)    # own move first, then the reply
+        if [board.cells[pos] for pos in moves] != [player, other]:
+            return None
+        node = self.root
+        for square, mover in zip(moves, [player, other]):
+            node = next((child for child in node.children if child.square == square and child.player == mover),
+                        None)
+            if node is None:
+                return None
+        return node
 
-        # simulation
-        result = playout(leaf)
-        log(f'Result of playout ({node.square}): {result}')
+    def get_move(self, board: Board, player):
+        """
+        :param board:
+        :param player:
+        :return: best move given current board
+        """
+        book_move = get_book_move(board, player)
+        if book_move is None:
+            book_move = get_endgame_move(board, player)     # few empty squares left: no need for playouts
+        if book_move is not None:
+            self.root = None
+            return book_move
+
+        root = self.find_subtree(board, player)
+        if root is None:
+            root = Node(get_other_player(player), None, None)    # the root stands for the opponent's last move
+            log('\nNEW MCTS RUN')
+        else:
+            root.parent = None
+            self.reused_games += root.games
+            log(f'\nMCTS RUN reusing {root.games} games')
+        root_depth = len(board.history)     # every loop pushes its path onto board, then pops back to here
+
+        # initialize children as every possible empty square at root node (symmetric duplicates share one child)
+        # on large boards only squares near the stones are candidates. A reused root keeps its children
+        candidates = set(get_candidate_squares(board))
+        squares = set(child.square for child in root.children)
+        for square in board.get_symmetry_distinct_moves():
+            if square not in candidates or square in squares:
+                continue
+            node = Node(player, root, square)
+            root.children.append(node)
+        root.untried = []
+
+        loops = 0
+        while loops < cfg.max_mcts_loops:
+            loops += 1
+
+            # selection
+            node = select_node(root, board)
+
+            # expansion
+            leaf = expand_node(node, board)
+
+            # simulation
+            result = playout(leaf, board)
+            log(f'Result of playout ({node.square}): {result}')
+
+            # backpropagation
+            back_propagate(leaf, result)
+            board.pop_to(root_depth)
+
+        # after running as long as allowed, play a forced win or else the most simulated move
+        best_node = max(root.children, key=lambda child: (child.square == root.forced_win, child.games))
+        log(f'Best node of current root: {best_node.square}')
+        self.root, self.cells, self.game = root, bytes(board.cells), (board.size, board.k)
+        return best_node.square
 
-        # backpropagation
-        back_propagate(leaf, result)
 
-    best_node = select_node(root)           # after running as long as allowed, return the best node from root
-    log(f'Best node of current root: {best_node.square}')
-    return best_node.square
+def mcts_new(board: Board, player):
+    """
+    Main Monte Carlo Tree Search algo (fresh tree every move, see MCTS to keep it between moves)
+    :param board:
+    :param player:
+    :return: best move given current board
+    """
+    return MCTS(reuse=False).get_move(board, player)
 
 
-def select_node(node: Node):
+def select_node(node: Node, board: Board):
     """
-    Select the node with the best uct value
+    Select the node with the best uct value, descending until a node that still has squares to expand
+    The square of every node passed through (including the selected one) is pushed onto board
     :param node:
+    :param board: board at the state of node, left at the state of the selected node
     :return:
     """
-    while len(node.children) > 0:
+    while len(node.children) > 0 and not node.untried:
+        # a forced win found by the threat search is always selected
+        if not node.threats_searched:
+            node.threats_searched = True
+            node.forced_win = find_forced_win(board, node.children[0].player)
+        if node.forced_win is not None:
+            child = next((child for child in node.children if child.square == node.forced_win), None)
+            if child is None:   # symmetric duplicate of a root child, or not a candidate square
+                child = Node(node.children[0].player, node, node.forced_win)
+                node.children.append(child)
+            node = child
+            board.push(node.square, node.player)
+            continue
+
+        # if either player can win with the square, take it
+        ending = next((child for child in node.children if board.is_game_ending_move(child.square)), None)
+        if ending is not None:
+            node = ending
+            board.push(node.square, node.player)
+            continue
+
         best_uct = -1
         best_nodes = []  # list of all nodes with max uct
 
         # pick the child node with the highest uct
         for child in node.children:
-            # if either player can win with the square, take it
-            if node.board.is_game_ending_move(child.square):
-                return child
             uct = child.get_uct()
             log(f'UCT of {child.square} = {uct}')
             if uct > best_uct:  # new max uct found, reset list
@@ -123,57 +225,85 @@ def select_node(node: Node):
         else:  # else if multiple nodes have the same uct, pick a random one
             node = best_nodes[random.randrange(len(best_nodes))]
             # print(f'{len(best_nodes)} best nodes, random picked: {node.square}')
+        board.push(node.square, node.player)
 
     log(f'Selected node at square: {node.square}')
     return node
 
 
-def expand_node(node):
+def expand_node(node, board: Board):
     """
-    The given node is the bottom of the current tree. Pick a random child of this node
+    The given node is the bottom of the current tree. Pick a square of this node that has no child yet
     and expand it to a new leaf/node. The playout will occur on the newly created leaf
     :param node:
+    :param board: board at the state of node; the leaf square is pushed onto it
     :return:
     """
-    if not node.board.get_empty_squares():  # node.square and node.board.is_gameover(node.square, node.player):
+    if board.get_empty_count() == 0 or is_won(node, board):
         # print('Unable to expand terminal node')
         return node
+    if node.untried is None:
+        node.untried = get_candidate_squares(board)
 
     # expansion policy: pick using the policy most often, allow some randomness
     rand = random.random()
-    if rand > cfg.expand_random_chance:
-        selected_square = node.board.get_random_empty_square()
-    else:
-        queue = node.board.get_emtpy_cell_priority_queue(node.player)
-        if queue.empty():
-            selected_square = node.board.get_random_empty_square()  # if queue is empty, pick a random square
-        else:
+    selected_square = None
+    if rand <= cfg.expand_random_chance:
+        queue = board.get_emtpy_cell_priority_queue(get_other_player(node.player))
+        untried = set(node.untried)
+        while not queue.empty():
             best = queue.get()
-            selected_square = best[1]
+            if best[1] in untried:
+                selected_square = best[1]
+                break
+    if selected_square is None:     # random pick, or the queue is empty
+        selected_square = node.untried[random.randrange(len(node.untried))]
+    node.untried.remove(selected_square)
 
-    leaf = Node(node.board, node.player, node, selected_square)
-    leaf.board.make_move(selected_square, leaf.player)
+    leaf = Node(get_other_player(node.player), node, selected_square)
+    node.children.append(leaf)
+    board.push(selected_square, leaf.player)
 
     return leaf
 
 
-def playout(node):
+def is_won(node: Node, board: Board):
+    # the move of node ended the game
+    return node.square is not None and board.is_win(node.square, node.player)
+
+
+def playout(node, board: Board):
     """
     For the given node, simulate a playout by selecting random moves for each player
     Start with the opposite player since the previous selection was done by current player
     Return 1 if the current player wins, 0.5 for a tie, 0 for a loss
     :param node:
+    :param board: board at the state of node (node.square already taken); restored before returning
+    :return:
+    """
+    if is_won(node, board):
+        return 1
+    if cfg.playout_backend == BITBOARD_BACKEND:
+        return simulate_bitboard(node, BitBoard.from_board(board), list(board.iter_empty_squares()))
+    start_depth = len(board.history)
+    try:
+        return simulate(node, board)
+    finally:
+        board.pop_to(start_depth)     # undo the simulated moves
+
+
+def simulate(node, board: Board):
+    """
+    Random playout body for playout(); moves are pushed onto board and left for the caller to undo
+    :param node:
+    :param board:
     :return:
     """
-    # create local copy of board to simulate playout
-    board = Board(size=node.board.size, k=node.board.k, board=node.board.board)
     selected_square = node.square
-    board.make_move(node.square, node.player)       # player1 makes its move
-    empty_squares = board.get_empty_squares()
     curr_player = get_other_player(node.player)     # player2 moves next
-    while empty_squares:                            # keep picking squares until board is filled
-        selected_square = empty_squares[random.randrange(len(empty_squares))]
-        board.make_move(selected_square, curr_player)
+    while board.get_empty_count() > 0:              # keep picking squares until board is filled
+        selected_square = board.get_random_empty_square()
+        board.push(selected_square, curr_player)
 
         if board.is_win(selected_square, node.player):
             log(f'Result of playout of {node.square}: WIN')
@@ -191,7 +321,6 @@ def playout(node):
                 board.show()
             return 0
 
-        empty_squares = board.get_empty_squares()
         curr_player = get_other_player(curr_player)  # alternate between player 1 and 2 each loop
 
     if board.is_win(selected_square, curr_player) and curr_player == node.player:      # return 1 if the target player won (use node.square since they may have not made the last move)
@@ -210,23 +339,56 @@ def playout(node):
     return 0
 
 
+def simulate_bitboard(node, board: BitBoard, squares: list):
+    """
+    Random playout body for playout() on a BitBoard copy of the position. The empty squares are shuffled once
+    and taken in that order, which gives the same random games as drawing a random empty square every move
+    :param node:
+    :param board: left at the end of the playout
+    :param squares: empty squares of board (shuffled in place)
+    :return:
+    """
+    random.shuffle(squares)
+    curr_player = get_other_player(node.player)     # player2 moves next
+    for square in squares:
+        board.make_move(square, curr_player)
+        if board.is_win(square, curr_player):
+            result = 1 if curr_player == node.player else 0
+            log(f'Result of playout of {node.square}: {"WIN" if result else "LOSS"}')
+            if DEBUG:
+                board.show()
+            return result
+        curr_player = get_other_player(curr_player)  # alternate between player 1 and 2 each loop
+
+    log(f'Result of playout of {node.square}: TIE')
+    if DEBUG:
+        board.show()
+    return 0.5
+
+
 def back_propagate(node: Node, result: int):
     """
     Once a node has been simulated increase the game and (possibly) win counters for it and all parent nodes
+    Wins are counted for the player of each node, so the result flips from one level to the next
     :param node:
-    :param result:
+    :param result: for node.player
     :return:
     """
     node.games += 1
     node.wins += result  # 0 = loss, 0.5 = tie, 1 = win
     if not node.parent:
         return
-    back_propagate(node.parent, result)
+    back_propagate(node.parent, 1 - result)
 
 
 class TestMCTS(unittest.TestCase):
     def setUp(self) -> None:
         self.board = Board((3, 3), 3)
+        self.endgame_empties = cfg.endgame_empties
+        cfg.endgame_empties = 0     # test the search, not the endgame solver
+
+    def tearDown(self) -> None:
+        cfg.endgame_empties = self.endgame_empties
 
     def test_mcts_new(self):
         """
@@ -244,6 +406,73 @@ class TestMCTS(unittest.TestCase):
         print(f'Player1 Avg Time/Move: {p1_runtime}')
         print(f'Player2 Avg Time/Move: {p2_runtime}')
 
+    def test_playout_positions(self):
+        """
+        The players alternate along every path of the tree: when a playout starts, the player of the leaf has
+        made the last move
+        """
+        board = Board((4, 4), 4)
+        root = Node(2, None, None)
+        for square in board.get_empty_squares():
+            root.children.append(Node(1, root, square))
+        root.untried = []
+        for _ in range(100):
+            leaf = expand_node(select_node(root, board), board)
+            stones = [board.cells.count(1), board.cells.count(2)]
+            self.assertEqual(stones[0] - stones[1], 1 if leaf.player == 1 else 0)
+            self.assertEqual(sum(stones), len(board.history))
+            back_propagate(leaf, playout(leaf, board))
+            board.pop_to(0)
+        self.assertEqual(root.games, 100)
+        self.assertTrue(any(child.children for child in root.children))     # the tree grows below the root
+
+    def test_playout_backends(self):
+        """
+        Playouts on both boards score the same forced results and leave the board as it was
+        """
+        backend = cfg.playout_backend
+        try:
+            for cfg.playout_backend in [ARRAY_BACKEND, BITBOARD_BACKEND]:
+                # X takes the last square and wins the top row: a loss for O, who moved last
+                board = Board((3, 3), 3, board=[[1, 1, 0], [2, 2, 1], [2, 1, 2]])
+                self.assertEqual(playout(Node(2, None, 8), board), 0)
+                # X takes the last square without a line
+                board = Board((3, 3), 3, board=[[1, 2, 1], [1, 2, 2], [2, 1, 0]])
+                self.assertEqual(playout(Node(2, None, 6), board), 0.5)
+                self.assertEqual(board.get_empty_squares(), [8])
+                self.assertEqual(board.history, [])
+        finally:
+            cfg.playout_backend = backend
+
+    def test_tree_reuse(self):
+        """
+        After its move and a reply the search continues from the grandchild of the old root
+        """
+        loops = cfg.max_mcts_loops
+        cfg.max_mcts_loops = 200
+        try:
+            bot = MCTS()
+            board = Board((5, 5), 4)
+            move = bot(board, 1)
+            self.assertTrue(all(child.player == 1 for child in bot.root.children))
+            child = next(child for child in bot.root.children if child.square == move)
+            grandchild = max(child.children, key=lambda node: node.games)
+            self.assertEqual(grandchild.player, 2)
+            games = grandchild.games
+            board.make_move(move, 1)
+            board.make_move(grandchild.square, 2)
+            bot(board, 1)
+            self.assertIs(bot.root, grandchild)
+            self.assertIsNone(grandchild.parent)
+            self.assertEqual(bot.reused_games, games)
+            self.assertEqual(grandchild.games, games + cfg.max_mcts_loops)
+
+            bot(Board((5, 5), 4), 1)     # new game: fresh tree
+            self.assertIsNot(bot.root, grandchild)
+            self.assertEqual(bot.reused_games, games)
+        finally:
+            cfg.max_mcts_loops = loops
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+
+# AI 531 - m,n,k
+# Wadood Alam
+# Joe Nguyen
+# Matthew Pacey
+
+import unittest
+
+from board import Board
+from util import get_other_player
+
+"""
+Move ordering for the alpha-beta searches
+Moves are tried in the order: squares that win for the player to move, the transposition table move, squares
+that block an opponent win, the killer moves of the ply, then every other empty square by history score with
+the filled neighbor count breaking ties. Everything it reads is kept up to date by Board.make_move, so ordering
+a node is one sort of the empty squares
+
+Killer moves: the last two moves that caused a cutoff at the same ply (number of stones on the board), which
+are often good in the sibling positions too
+History: per player and square, the sum of depth * depth over every cutoff the square caused
+"""
+
+N_KILLERS = 2
+MAX_NEIGHBORS = 8
+
+
+class MoveOrderer:
+    def __init__(self, size, k):
+        """
+        :param size: (m, n) of the boards that will be ordered
+        :param k:
+        """
+        self.size = tuple(size)
+        self.k = k
+        n_cells = self.size[0] * self.size[1]
+        self.killers = [[None] * N_KILLERS for _ in range(n_cells + 1)]     # indexed by ply
+        self.history = [None, [0] * n_cells, [0] * n_cells]                 # indexed by player, square
+        self.cutoffs = 0            # number of cutoffs recorded
+        self.first_cutoffs = 0      # how many of them came from the first move searched
+
+    def fits(self, board: Board):
+        return board.size == self.size and board.k == self.k
+
+    def clear(self):
+        self.__init__(self.size, self.k)
+
+    def get_ply(self, board: Board):
+        # number of stones on the board
+        return len(self.killers) - 1 - board.get_empty_count()
+
+    def age(self):
+        """
+        Halve the history scores (between searches) so recent cutoffs count more than old ones
+        """
+        for player in [1, 2]:
+            self.history[player] = [score >> 1 for score in self.history[player]]
+
+    def order(self, board: Board, player, table_move=None, candidates=None):
+        """
+        :param board:
+        :param player: player to move
+        :param table_move: best move stored in the transposition table (or None)
+        :param candidates: squares to order (default: every empty square); winning and blocking squares, the
+        table move and killers are always included
+        :return: squares of board, best first
+        """
+        history = self.history[player]
+        counts = board.neighbor_counts
+        n_cells = board.geometry.n_cells
+        # ties go to the lower square, so the order does not depend on the order of the empty square list
+        moves = sorted(board.iter_empty_squares() if candidates is None else candidates,
+                       key=lambda move: (history[move] * (MAX_NEIGHBORS + 1) + counts[move]) * n_cells - move,
+                       reverse=True)
+
+        wins = board.winning_squares[player]
+        blocks = board.winning_squares[get_other_player(player)]
+        front = sorted(wins)
+        if table_move is not None and table_move not in wins and board.cells[table_move] == 0:
+            front.append(table_move)
+        front += [move for move in sorted(blocks) if move not in wins and move != table_move]
+        for move in self.killers[self.get_ply(board)]:
+            if move is not None and board.cells[move] == 0 and move not in front:
+                front.append(move)
+        if not front:
+            return moves
+        first = set(front)
+        return front + [move for move in moves if move not in first]
+
+    def record_cutoff(self, board: Board, player, move: int, depth: int, first: bool = False):
+        """
+        Remember a move that caused a cutoff
+        :param board: board the move was made on (the move itself already undone)
+        :param player: player that made the move
+        :param move:
+        :param depth: remaining depth of the node
+        :param first: True if move was the first one searched at the node
+        """
+        self.cutoffs += 1
+        self.first_cutoffs += first
+        self.history[player][move] += depth * depth
+        killers = self.killers[self.get_ply(board)]
+        if killers[0] != move:
+            killers[1:] = killers[:-1]
+            killers[0] = move
+
+
+class TestMoveOrderer(unittest.TestCase):
+    def test_order(self):
+        board = Board((4, 4), 3)
+        for pos, player in [(0, 1), (1, 1), (5, 2), (10, 2)]:
+            board.make_move(pos, player)
+        orderer = MoveOrderer(board.size, board.k)
+        moves = orderer.order(board, 1)
+        self.assertEqual(sorted(moves), board.get_empty_squares())
+        self.assertEqual(moves[0], 2)                   # winning square first
+        self.assertEqual(moves[1], 15)                  # then blocking 5-10-15 (0 is taken)
+        moves = orderer.order(board, 2, table_move=6)
+        self.assertEqual(moves[:3], [15, 6, 2])         # own win, table move, block
+
+    def test_killers_history(self):
+        board = Board((4, 4), 3)
+        board.make_move(5, 1)
+        orderer = MoveOrderer(board.size, board.k)
+        orderer.record_cutoff(board, 2, 15, 3)
+        orderer.record_cutoff(board, 2, 12, 1, first=True)
+        self.assertEqual(orderer.order(board, 2)[:2], [12, 15])    # killers, newest first
+        self.assertEqual((orderer.cutoffs, orderer.first_cutoffs), (2, 1))
+
+        board.make_move(0, 2)       # another ply: no killers, history puts 15 (depth 3) before 12 (depth 1)
+        moves = orderer.order(board, 2)
+        self.assertEqual(moves[:2], [15, 12])
+        self.assertEqual(orderer.order(board, 1)[0], 1)     # player 1 has no history: most neighbors first
+
+        orderer.age()
+        self.assertEqual(orderer.history[2][15], 4)
+
+    def test_other_board(self):
+        """
+        The engine falls back to the plain ordering when its orderer was made for another board
+        """
+        import alphaBeta
+        saved = alphaBeta.move_orderer
+        try:
+            alphaBeta.move_orderer = MoveOrderer((3, 3), 3)
+            board = Board((4, 4), 3)
+            board.make_move(5, 1)
+            self.assertEqual(sorted(alphaBeta.get_ordered_moves(board, 2, None)), board.get_empty_squares())
+            alphaBeta.record_cutoff(board, 2, 15, 1, True)
+            self.assertEqual(alphaBeta.move_orderer.cutoffs, 0)
+        finally:
+            alphaBeta.move_orderer = saved
+
+
+if __name__ == '__main__':
+    unittest.main()
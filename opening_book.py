@@ -0,0 +1,276 @@
+#!/usr/bin/python3
+
+# AI 531 - m,n,k
+# Wadood Alam
+# Joe Nguyen
+# Matthew Pacey
+
+import argparse
+import os
+import sys
+import time
+import unittest
+from typing import Tuple
+
+import numpy as np
+
+from board import Board
+from transposition import TranspositionTable, get_key
+from util import log
+
+import cfg
+
+"""
+Opening book: best moves for the first few plies of an m,n,k game, found once by a deep offline search
+(build_book) and looked up by both engines before they search
+
+File layout: 8 byte header (b'MNK', m, n, k, two zero bytes) followed by fixed size records sorted by key.
+A record holds the transposition table key of a position (canonical zobrist hash and player to move), the best
+move in the canonical frame of the position, the negamax value for the player to move and the search depth.
+Books are opened with np.memmap and looked up with a binary search, so loading one costs nothing and only the
+pages a lookup touches are read
+
+Books are built offline from the command line: python opening_book.py build m n k [--plies P] (without
+arguments the module runs its tests)
+"""
+
+MAGIC = b'MNK'
+HEADER_SIZE = 8
+RECORD_DTYPE = np.dtype([('key', '<u8'), ('move', '<u2'), ('value', '<i2'), ('depth', '<u2')])
+
+books = {}  # (m, n, k) -> OpeningBook (None if there is no book file), loaded on first use
+
+
+def get_book_path(size: Tuple[int, int], k: int, directory: str = None):
+    """
+    :param size:
+    :param k:
+    :param directory: default: cfg.opening_book_dir
+    :return: file name of the book for m,n,k
+    """
+    directory = cfg.opening_book_dir if directory is None else directory
+    return os.path.join(directory, f'book_{size[0]}x{size[1]}_k{k}.bin')
+
+
+class OpeningBook:
+    def __init__(self, path: str):
+        """
+        :param path: book file written by write_book
+        """
+        header = np.fromfile(path, dtype=np.uint8, count=HEADER_SIZE)
+        assert header[:3].tobytes() == MAGIC, f'{path} is not an opening book'
+        self.size = (int(header[3]), int(header[4]))
+        self.k = int(header[5])
+        n_records = (os.path.getsize(path) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+        if n_records > 0:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE, shape=(n_records,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+        self.keys = self.records['key']
+
+    def __len__(self):
+        return len(self.records)
+
+    def probe(self, key: int):
+        """
+        :param key: transposition table key
+        :return: record (key, move, value, depth) or None
+        """
+        i = int(np.searchsorted(self.keys, np.uint64(key)))
+        if i < len(self.keys) and int(self.keys[i]) == key:
+            return self.records[i]
+        return None
+
+    def lookup(self, board: Board, player):
+        """
+        :param board:
+        :param player: player to move
+        :return: book move for board (mapped from the canonical frame onto board), or None
+        """
+        if board.size != self.size or board.k != self.k:
+            return None
+        record = self.probe(get_key(board, player))
+        if record is None:
+            return None
+        symmetry = board.get_canonical_symmetry()
+        return board.geometry.inverse_symmetries[symmetry][int(record['move'])]
+
+
+def write_book(path: str, size: Tuple[int, int], k: int, entries: dict):
+    """
+    :param path:
+    :param size:
+    :param k:
+    :param entries: key -> (canonical move, value, depth)
+    """
+    records = np.zeros(len(entries), dtype=RECORD_DTYPE)
+    for i, key in enumerate(sorted(entries)):
+        move, value, depth = entries[key]
+        records[i] = (key, move, value, depth)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(MAGIC + bytes([size[0], size[1], k, 0, 0]))
+        f.write(records.tobytes())
+
+
+def search_position(board: Board, player, max_depth: int, time_budget):
+    """
+    Deep negamax search of one book position, with its own transposition table and move orderer (the engine's
+    are put back afterwards)
+    :return: value for player, best move and the depth searched
+    """
+    import alphaBeta    # imported here: alphaBeta consults the book itself
+    saved = alphaBeta.negamax_table, alphaBeta.move_orderer
+    try:
+        alphaBeta.negamax_table, alphaBeta.move_orderer = TranspositionTable(), None
+        alphaBeta.init_move_orderer(board)
+        return alphaBeta.iterative_deepening(board, player, max_depth, time_budget, None,
+                                             alphaBeta.negamax_root, alphaBeta.WIN_SCORE)
+    finally:
+        alphaBeta.negamax_table, alphaBeta.move_orderer = saved
+
+
+def build_book(size: Tuple[int, int], k: int, plies: int = 2, max_depth: int = None, time_budget=10.,
+               path: str = None):
+    """
+    Search every position reachable in at most plies moves from the empty board (symmetric positions once)
+    and write the best moves to a book file
+    :param size:
+    :param k:
+    :param plies: number of moves from the empty board covered by the book
+    :param max_depth: search depth per position (default: every empty square)
+    :param time_budget: seconds per position (None: no limit)
+    :param path: default: get_book_path(size, k)
+    :return: path of the book
+    """
+    path = get_book_path(size, k) if path is None else path
+    board = Board(size, k)
+    max_depth = size[0] * size[1] if max_depth is None else max_depth
+    entries = {}
+    frontier = [[]]     # move sequences reaching the positions of the current ply
+    for ply in range(plies + 1):
+        player = 1 + ply % 2
+        next_frontier = []
+        for moves in frontier:
+            for i, move in enumerate(moves):
+                board.push(move, 1 + i % 2)
+            key = get_key(board, player)
+            if key not in entries:
+                start = time.time()
+                value, move, depth = search_position(board, player, max_depth, time_budget)
+                canonical_move = board.geometry.symmetries[board.get_canonical_symmetry()][move]
+                entries[key] = (canonical_move, value, depth)
+                log(f'Book {moves}: {move=}, {value=}, {depth=} ({time.time() - start:.1f}s)')
+                if ply < plies:
+                    for reply in board.get_symmetry_distinct_moves():
+                        board.push(reply, player)
+                        ended = board.is_win(reply, player) or board.get_empty_count() == 0
+                        board.pop()
+                        if not ended:
+                            next_frontier.append(moves + [reply])
+            board.pop_to(0)
+        frontier = next_frontier
+    write_book(path, size, k, entries)
+    books.pop((size[0], size[1], k), None)
+    return path
+
+
+def get_book(size: Tuple[int, int], k: int):
+    """
+    :param size:
+    :param k:
+    :return: the OpeningBook for m,n,k from cfg.opening_book_dir, or None if there is no book file
+    """
+    key = (size[0], size[1], k)
+    if key not in books:
+        path = get_book_path(size, k)
+        books[key] = OpeningBook(path) if os.path.exists(path) else None
+    return books[key]
+
+
+def get_book_move(board: Board, player):
+    """
+    Opening book move for board, if books are enabled and the position is in the book
+    :param board:
+    :param player: player to move
+    :return: move or None
+    """
+    if cfg.opening_book_dir is None:
+        return None
+    book = get_book(board.size, board.k)
+    if book is None:
+        return None
+    move = book.lookup(board, player)
+    if move is not None:
+        log(f'Opening book move for player {player}: {move}')
+    return move
+
+
+def main(args=None):
+    """
+    Command line: build the book for m,n,k into cfg.opening_book_dir
+    :param args: command line arguments after 'build' (default: sys.argv)
+    :return: path of the book
+    """
+    parser = argparse.ArgumentParser(prog='opening_book.py build',
+                                     description='Build an opening book into cfg.opening_book_dir')
+    parser.add_argument('m', type=int, help='board rows')
+    parser.add_argument('n', type=int, help='board columns')
+    parser.add_argument('k', type=int, help='number of consecutive cells to win')
+    parser.add_argument('--plies', type=int, default=2, help='moves from the empty board covered by the book')
+    parser.add_argument('--max-depth', type=int, default=None, help='search depth per position (default: all)')
+    parser.add_argument('--time-budget', type=float, default=10., help='seconds per position (0: no limit)')
+    args = parser.parse_args(args)
+    if cfg.opening_book_dir is None:
+        parser.error('cfg.opening_book_dir is None')
+    path = build_book((args.m, args.n), args.k, args.plies, args.max_depth, args.time_budget or None)
+    print(f'Wrote {len(OpeningBook(path))} positions to {path}')
+    return path
+
+
+class TestOpeningBook(unittest.TestCase):
+    def test_build_lookup(self):
+        import tempfile
+        import alphaBeta
+        engine = alphaBeta.negamax_table, alphaBeta.move_orderer
+        with tempfile.TemporaryDirectory() as directory:
+            path = build_book((3, 3), 3, plies=2, time_budget=None, path=os.path.join(directory, 'book.bin'))
+            self.assertEqual((alphaBeta.negamax_table, alphaBeta.move_orderer), engine)     # engine state kept
+            book = OpeningBook(path)
+            self.assertEqual((book.size, book.k), ((3, 3), 3))
+            self.assertEqual(len(book), 1 + 3 + 12)      # symmetric distinct positions after 0, 1 and 2 moves
+            self.assertTrue((np.diff(book.keys.astype(np.float64)) > 0).all())
+
+            board = Board((3, 3), 3)
+            self.assertIsNotNone(book.lookup(board, 1))
+            self.assertEqual(int(book.probe(get_key(board, 1))['value']), 0)     # 3x3 is a draw
+            for corner in [0, 2, 6, 8]:      # the only reply to a corner that does not lose is the center
+                board.make_move(corner, 1)
+                self.assertEqual(book.lookup(board, 2), 4)
+                board.make_move(corner, 0)
+            board.make_move(4, 1)
+            board.make_move(1, 2)            # an edge reply to the center loses
+            record = book.probe(get_key(board, 1))
+            self.assertGreater(int(record['value']), 0)
+            self.assertIsNone(book.lookup(Board((4, 4), 3), 1))
+
+    def test_command_line(self):
+        import tempfile
+        book_dir = cfg.opening_book_dir
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                cfg.opening_book_dir = directory
+                path = main(['3', '3', '3', '--plies', '1', '--time-budget', '0'])
+                self.assertEqual(path, get_book_path((3, 3), 3))
+                self.assertEqual(len(OpeningBook(path)), 1 + 3)
+        finally:
+            cfg.opening_book_dir = book_dir
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['build']:     # python opening_book.py build m n k [options]
+        main(sys.argv[2:])
+    else:
+        unittest.main()
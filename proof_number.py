@@ -0,0 +1,280 @@
+#!/usr/bin/python3
+
+# AI 531 - m,n,k
+# Wadood Alam
+# Joe Nguyen
+# Matthew Pacey
+
+import unittest
+from typing import Tuple
+
+from board import Board
+from transposition import SIDE_KEYS, get_key
+from util import get_other_player, log
+
+import cfg
+
+"""
+Depth-first proof-number search (df-pn) for solving positions: the game theoretic value of a position and a
+move that achieves it, without a depth limit
+
+A df-pn search proves or disproves one goal. The attacker's goal is to win; the defender's goal is to stop that
+(a draw or a defender win both do). Every node keeps two numbers from the point of view of the player to move,
+phi (how many leaves still have to be solved to prove the mover reaches its goal) and delta (the same for the
+opponent). The search always expands the most proving child and only returns to the parent when the child's
+numbers pass the thresholds the parent gave it. Solving a position takes up to two searches: can the player to
+move win? If not, can the opponent win? (if not, the game is a draw)
+
+Positions are stored in a transposition table keyed by canonical hash and player to move, so transpositions
+and symmetric positions are solved once
+"""
+
+# results
+WIN = 1
+DRAW = 0
+LOSS = -1
+UNKNOWN = None  # the budget ran out first
+
+INF = 10 ** 9   # proof or disproof number of a solved node
+EPSILON = 0.25  # the 1 + epsilon trick: a child may grow past the second best child a little before switching
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class ProofNumberSearch:
+    def __init__(self, node_budget: int = None, max_entries: int = None):
+        """
+        :param node_budget: nodes expanded per solve before giving up (default: cfg.pn_node_budget, None: no limit)
+        :param max_entries: transposition table entries per goal before giving up (default: cfg.pn_max_entries)
+        """
+        self.node_budget = cfg.pn_node_budget if node_budget is None else node_budget
+        self.max_entries = cfg.pn_max_entries if max_entries is None else max_entries
+        self.table = {}     # key -> [phi, delta] for the current attacker
+        self.children = {}  # key -> children of the position (see get_children)
+        self.attacker = None
+        self.nodes = 0
+
+    def solve(self, board: Board, player):
+        """
+        :param board: left unchanged
+        :param player: player to move
+        :return: WIN, DRAW, LOSS or UNKNOWN for player, and a move that achieves it (None for a loss or unknown)
+        """
+        self.nodes = 0
+        try:
+            proven, move = self.prove(board, player, player)
+            if proven:
+                return WIN, move
+            opponent_wins, move = self.prove(board, player, get_other_player(player))
+        except BudgetExceeded:
+            log(f'Proof number search gave up after {self.nodes} nodes')
+            return UNKNOWN, None
+        if opponent_wins:
+            return LOSS, None
+        return DRAW, move
+
+    def prove(self, board: Board, player, attacker):
+        """
+        Run df-pn for attacker's goal (winning) from board, player to move
+        :return: True if attacker wins, False if not, and a move that reaches the goal of player (or None)
+        """
+        self.attacker = attacker
+        self.table = {}
+        self.children = {}
+        root_depth = len(board.history)
+        try:
+            phi, delta = self.mid(board, player, INF, INF)
+        finally:
+            board.pop_to(root_depth)
+        mover_reaches_goal = phi == 0
+        move = self.get_goal_move(board, player) if mover_reaches_goal else None
+        return mover_reaches_goal == (player == attacker), move
+
+    def get_goal_move(self, board: Board, player):
+        # after a proof for the mover: a move that keeps the mover's goal (a child whose delta is 0)
+        wins = board.winning_squares[player]
+        if wins:
+            return min(wins)
+        to_board = board.geometry.inverse_symmetries[board.get_canonical_symmetry()]
+        children = self.get_children(board, player)
+        for move, key in children:
+            if self.table.get(key, (1, 1))[1] == 0:
+                return to_board[move]
+        # decided without searching (the attacker can no longer win): any move keeps the goal
+        return to_board[children[0][0]] if children else None
+
+    def evaluate(self, board: Board, player):
+        """
+        Numbers of a position that is decided without searching, from the point of view of player (to move)
+        A position never arises from a winning move: a position where the mover has a winning square is decided
+        right away, so its children are not searched
+        :return: (phi, delta) or None
+        """
+        if board.winning_squares[player]:
+            return 0, INF       # player wins next move: goal reached whichever side it is on
+        if board.get_empty_count() == 0:
+            return (INF, 0) if player == self.attacker else (0, INF)    # draw: only the defender's goal
+        if len(board.winning_squares[get_other_player(player)]) > 1:
+            return INF, 0       # opponent has two winning squares and player has none
+        # the attacker can no longer win if every window holds a defender stone or needs more attacker stones
+        # than the attacker has moves left
+        attacker_counts = board.window_counts[self.attacker]
+        defender_counts = board.window_counts[get_other_player(self.attacker)]
+        attacker_moves = (board.get_empty_count() + (player == self.attacker)) // 2
+        target = board.k - attacker_moves
+        if not any(count >= target for count, blocked in zip(attacker_counts, defender_counts) if not blocked):
+            return (INF, 0) if player == self.attacker else (0, INF)
+        return None
+
+    def get_children(self, board: Board, player):
+        """
+        :return: list of (move, key of the position after the move), one per symmetric group. Moves are in the
+        canonical frame of the position, so the list is valid for every symmetric version of it
+        """
+        geometry = board.geometry
+        to_canonical = geometry.symmetries[board.get_canonical_symmetry()]
+        other = get_other_player(player)
+        blocks = board.winning_squares[other]
+        moves = sorted(blocks) if blocks else board.iter_empty_squares()    # a threat has to be blocked
+        # child keys straight from the zobrist keys of every symmetry (as get_key would after pushing the move)
+        keys, side = board.zobrist_keys, SIDE_KEYS[other]
+        children = []
+        seen = set()
+        for move in moves:
+            key = min(k ^ z for k, z in zip(keys, geometry.symmetric_zobrist[move][player])) ^ side
+            if key not in seen:
+                seen.add(key)
+                children.append((to_canonical[move], key))
+        return children
+
+    def mid(self, board: Board, player, th_phi: int, th_delta: int):
+        """
+        Multiple iterative deepening: search below the position until its numbers reach a threshold
+        :param board: position to search (player to move)
+        :param player:
+        :param th_phi:
+        :param th_delta:
+        :return: (phi, delta) of the position
+        """
+        self.nodes += 1
+        if self.node_budget is not None and self.nodes > self.node_budget:
+            raise BudgetExceeded()
+        if self.max_entries is not None and len(self.table) > self.max_entries:
+            raise BudgetExceeded()
+
+        key = get_key(board, player)
+        numbers = self.table.get(key)
+        if numbers is None:
+            terminal = self.evaluate(board, player)
+            if terminal is not None:
+                self.table[key] = list(terminal)
+                return terminal
+            numbers = self.table[key] = [1, 1]
+        elif numbers[0] == 0 or numbers[1] == 0:
+            return tuple(numbers)
+
+        other = get_other_player(player)
+        children = self.children.get(key)
+        if children is None:
+            children = self.children[key] = self.get_children(board, player)
+        to_board = board.geometry.inverse_symmetries[board.get_canonical_symmetry()]
+        table = self.table
+        while True:
+            # phi = smallest delta of a child (the mover needs one good move), delta = sum of child phis
+            delta = 0
+            best, best_delta, second_delta, best_phi = None, INF, INF, INF
+            for move, child_key in children:
+                child_phi, child_delta = table.get(child_key, (1, 1))
+                delta = min(delta + child_phi, INF)
+                if child_delta < best_delta:
+                    best, second_delta, best_delta, best_phi = move, best_delta, child_delta, child_phi
+                elif child_delta < second_delta:
+                    second_delta = child_delta
+            phi = best_delta
+            numbers[0], numbers[1] = phi, delta
+            if phi >= th_phi or delta >= th_delta:
+                return phi, delta
+
+            child_th_phi = th_delta - delta + best_phi
+            child_th_delta = min(th_phi, int(second_delta * (1 + EPSILON)) + 1)
+            board.push(to_board[best], player)
+            self.mid(board, other, child_th_phi, child_th_delta)
+            board.pop()
+
+
+def solve(board: Board, player, node_budget: int = None, max_entries: int = None):
+    """
+    Game theoretic value of the position for player (to move)
+    :param board:
+    :param player:
+    :param node_budget: see ProofNumberSearch
+    :param max_entries: see ProofNumberSearch
+    :return: WIN, DRAW, LOSS or UNKNOWN, and a move that achieves it (None for a loss or unknown)
+    """
+    return ProofNumberSearch(node_budget, max_entries).solve(board, player)
+
+
+def get_random_positions(rng, cases, positions: int, stones: Tuple[int, int]):
+    """
+    Random positions for testing the solvers, with no game already won
+    :param rng: random.Random
+    :param cases: list of (size, k)
+    :param positions: positions tried per case (those with a win are skipped)
+    :param stones: least and most stones placed, alternating from player 1
+    :return: generator of (board, player to move)
+    """
+    for size, k in cases:
+        for _ in range(positions):
+            board = Board(size, k)
+            for i in range(rng.randint(*stones)):
+                board.make_move(rng.choice(board.get_empty_squares()), 1 + i % 2)
+            if any(board.is_win(pos, val) for pos in range(size[0] * size[1]) for val in [1, 2]):
+                continue
+            yield board, rng.choice([1, 2])
+
+
+class TestProofNumberSearch(unittest.TestCase):
+    def test_tic_tac_toe(self):
+        board = Board((3, 3), 3)
+        self.assertEqual(solve(board, 1)[0], DRAW)
+        board.make_move(0, 1)
+        board.make_move(1, 2)       # an edge reply to a corner loses
+        result, move = solve(board, 1)
+        self.assertEqual(result, WIN)
+        board.make_move(move, 1)
+        self.assertEqual(solve(board, 2)[0], LOSS)
+        self.assertEqual(len(board.history), 0)     # board left as it was
+
+    def test_agrees_with_negamax(self):
+        """
+        Results match a full depth negamax search on small positions
+        """
+        import random
+        from alphaBeta import negamax, WIN_SCORE
+        from transposition import TranspositionTable
+        import alphaBeta
+        cases = [((4, 4), 3), ((3, 4), 3), ((3, 5), 4), ((4, 4), 4)]
+        saved = alphaBeta.negamax_table, alphaBeta.move_orderer
+        try:
+            for board, player in get_random_positions(random.Random(531), cases, 4, (3, 6)):
+                result, move = solve(board, player)
+                alphaBeta.negamax_table = TranspositionTable()
+                alphaBeta.init_move_orderer(board)
+                value, _ = negamax(board, board.get_empty_count(), -WIN_SCORE, WIN_SCORE, player)
+                self.assertEqual(result, value // WIN_SCORE)
+                if result != LOSS:      # the move keeps the result
+                    board.push(move, player)
+                    if not board.is_win(move, player):
+                        self.assertEqual(solve(board, get_other_player(player))[0], -result)
+                    board.pop()
+        finally:
+            alphaBeta.negamax_table, alphaBeta.move_orderer = saved
+
+    def test_budget(self):
+        self.assertEqual(solve(Board((5, 5), 4), 1, node_budget=100), (UNKNOWN, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
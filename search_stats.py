@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+
+# AI 531 - m,n,k
+# Wadood Alam
+# Joe Nguyen
+# Matthew Pacey
+
+import unittest
+from collections import Counter
+
+"""
+Statistics of alpha-beta searches: where the nodes go and how well the move ordering and tables work
+One SearchStats is filled in per search (see alphaBeta.ab_search); merge adds the stats of many searches
+together, e.g. every move of a player over a match
+"""
+
+# how a move was decided
+SEARCH = 'search'
+BOOK = 'book'       # opening book
+FORCED = 'forced'   # threat search found a forced win
+ENDGAME = 'endgame' # exact endgame solver
+
+
+class SearchStats:
+    def __init__(self, algorithm: str = ''):
+        """
+        :param algorithm: name of the search ('ab', 'negamax', ...)
+        """
+        self.algorithm = algorithm
+        self.searches = 0                   # number of searches merged into these stats
+        self.sources = Counter()            # SEARCH/BOOK/FORCED/ENDGAME -> number of moves decided that way
+        self.nodes = 0
+        self.elapsed = 0.                   # seconds
+        self.cutoffs = Counter()            # ply below the root -> number of cutoffs
+        self.first_move_cutoffs = 0         # cutoffs caused by the first move searched at a node
+        self.table_probes = 0               # transposition table
+        self.table_hits = 0
+        self.max_ply = 0                    # deepest ply below the root reached
+        self.completed_depth = 0            # depth of the last completed iteration (summed when merged)
+
+    @property
+    def total_cutoffs(self):
+        return sum(self.cutoffs.values())
+
+    @property
+    def nodes_per_sec(self):
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0.
+
+    @property
+    def first_move_cutoff_rate(self):
+        # fraction of cutoffs found by the first move: a measure of the move ordering
+        total = self.total_cutoffs
+        return self.first_move_cutoffs / total if total else 0.
+
+    @property
+    def table_hit_rate(self):
+        return self.table_hits / self.table_probes if self.table_probes else 0.
+
+    def add_cutoff(self, ply: int, first: bool):
+        self.cutoffs[ply] += 1
+        self.first_move_cutoffs += first
+
+    def merge(self, other: 'SearchStats'):
+        """
+        Add the stats of other to these
+        :param other:
+        :return: self
+        """
+        self.algorithm = self.algorithm or other.algorithm
+        self.searches += other.searches
+        self.sources.update(other.sources)
+        self.nodes += other.nodes
+        self.elapsed += other.elapsed
+        self.cutoffs.update(other.cutoffs)
+        self.first_move_cutoffs += other.first_move_cutoffs
+        self.table_probes += other.table_probes
+        self.table_hits += other.table_hits
+        self.max_ply = max(self.max_ply, other.max_ply)
+        self.completed_depth += other.completed_depth
+        return self
+
+    def as_dict(self):
+        """
+        :return: flat dict of the stats (e.g. for one csv row)
+        """
+        return {
+            'algorithm': self.algorithm,
+            'searches': self.searches,
+            'nodes': self.nodes,
+            'elapsed': round(self.elapsed, 4),
+            'nodes_per_sec': int(self.nodes_per_sec),
+            'cutoffs': self.total_cutoffs,
+            'first_move_cutoff_rate': round(self.first_move_cutoff_rate, 4),
+            'table_hit_rate': round(self.table_hit_rate, 4),
+            'max_ply': self.max_ply,
+            'book_moves': self.sources[BOOK],
+            'forced_moves': self.sources[FORCED],
+            'endgame_moves': self.sources[ENDGAME],
+        }
+
+    def __str__(self):
+        return ', '.join(f'{key}={value}' for key, value in self.as_dict().items())
+
+
+class TestSearchStats(unittest.TestCase):
+    def test_merge(self):
+        first = SearchStats('ab')
+        first.searches, first.nodes, first.elapsed = 1, 1000, 0.5
+        first.add_cutoff(1, True)
+        first.add_cutoff(1, False)
+        first.add_cutoff(3, True)
+        first.table_probes, first.table_hits = 10, 4
+        first.sources[SEARCH] += 1
+        self.assertEqual(first.nodes_per_sec, 2000)
+        self.assertAlmostEqual(first.first_move_cutoff_rate, 2 / 3)
+
+        second = SearchStats('ab')
+        second.searches, second.nodes, second.elapsed, second.max_ply = 1, 500, 0.25, 4
+        second.sources[BOOK] += 1
+        total = SearchStats().merge(first).merge(second)
+        self.assertEqual(total.algorithm, 'ab')
+        self.assertEqual((total.searches, total.nodes, total.max_ply), (2, 1500, 4))
+        self.assertEqual(total.cutoffs, {1: 2, 3: 1})
+        self.assertEqual(total.nodes_per_sec, 2000)
+        self.assertEqual(total.table_hit_rate, 0.4)
+        self.assertEqual(total.as_dict()['book_moves'], 1)
+        self.assertEqual(SearchStats().nodes_per_sec, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+
+# AI 531 - m,n,k
+# Wadood Alam
+# Joe Nguyen
+# Matthew Pacey
+
+import unittest
+
+from board import Board
+from util import get_other_player, log
+
+import cfg
+
+"""
+Threat space search for forced wins (victory by continuous threats)
+The attacker only plays moves that leave it a square that wins on the next move (a threat), so the defender's
+reply is forced: it has to take that square. A threat that leaves two winning squares cannot be stopped. The
+search follows these narrow forcing lines much deeper than a full width search could
+Only proves wins: a None result means no forced win was found within the depth, not that there is none
+"""
+
+
+def get_threat_moves(board: Board, player):
+    """
+    Empty squares that would give player a winning square: the free cells of every window holding k - 2 of
+    player's stones and no opponent stone
+    :param board:
+    :param player:
+    :return: sorted list of squares
+    """
+    counts, other_counts = board.window_counts[player], board.window_counts[get_other_player(player)]
+    cells = board.cells
+    target = board.k - 2
+    moves = set()
+    for w, window in enumerate(board.geometry.windows):
+        if counts[w] == target and other_counts[w] == 0:
+            moves.update(cell for cell in window if cells[cell] == 0)
+    return sorted(moves)
+
+
+def find_forced_win(board: Board, player, max_depth: int = None):
+    """
+    Search for a sequence of threats that wins for player no matter how the opponent replies
+    :param board: left unchanged
+    :param player: player to move
+    :param max_depth: plies to search, counting both sides (default: cfg.threat_search_depth)
+    :return: first move of a forced win, or None
+    """
+    max_depth = cfg.threat_search_depth if max_depth is None else max_depth
+    if max_depth <= 0 or board.get_empty_count() == 0:
+        return None
+    failed = {}     # zobrist key -> deepest depth the position was searched without finding a win
+    return search_threats(board, player, max_depth, failed)
+
+
+def search_threats(board: Board, player, depth: int, failed: dict):
+    # attacker (player) to move; returns the winning first move or None
+    wins = board.winning_squares[player]
+    if wins:
+        return min(wins)
+    if depth < 3 or failed.get(board.zobrist, -1) >= depth:   # a threat takes 3 plies to turn into a win
+        return None
+
+    other = get_other_player(player)
+    blocks = board.winning_squares[other]
+    if len(blocks) > 1:
+        return None
+    moves = get_threat_moves(board, player)
+    if blocks:      # the opponent threatens to win: only blocking with a threat keeps the sequence going
+        moves = [move for move in moves if move in blocks]
+
+    for move in moves:
+        board.push(move, player)
+        threats = board.winning_squares[player]
+        won = False
+        if board.winning_squares[other]:
+            pass    # the opponent wins next move instead of answering the threat
+        elif len(threats) > 1:
+            won = True      # double threat: only one can be blocked
+        elif threats:
+            reply = next(iter(threats))
+            board.push(reply, other)
+            if not board.is_win(reply, other):
+                won = search_threats(board, player, depth - 2, failed) is not None
+            board.pop()
+        board.pop()
+        if won:
+            log(f'Forced win for player {player} starting with {move}')
+            return move
+
+    failed[board.zobrist] = depth
+    return None
+
+
+class TestThreatSearch(unittest.TestCase):
+    def test_threat_moves(self):
+        board = Board((4, 4), 3)
+        board.make_move(5, 1)
+        board.make_move(6, 2)
+        self.assertEqual(get_threat_moves(board, 1), [0, 1, 2, 8, 9, 10, 13, 15])
+        self.assertEqual(get_threat_moves(board, 2), [1, 2, 3, 9, 10, 11, 12, 14])
+
+    def test_double_threat(self):
+        board = Board((5, 5), 3)
+        board.make_move(12, 1)
+        board.make_move(0, 2)
+        move = find_forced_win(board, 1, 3)
+        board.push(move, 1)
+        self.assertGreater(len(board.get_winning_squares(1)), 1)
+        self.assertIsNone(find_forced_win(Board((3, 3), 3), 1, 9))
+
+    def test_forced_sequence(self):
+        """
+        Player 1 needs a forcing threat before the double threat; the result agrees with full search
+        """
+        from alphaBeta import negamax, WIN_SCORE
+        from transposition import TranspositionTable
+        import alphaBeta
+        board = Board((5, 5), 4, board=[[1, 1, 0, 0, 2],
+                                        [0, 1, 0, 0, 0],
+                                        [0, 0, 0, 0, 0],
+                                        [2, 0, 2, 0, 0],
+                                        [0, 0, 0, 0, 2]])
+        self.assertIsNone(find_forced_win(board, 1, 7))
+        move = find_forced_win(board, 1, 9)
+        self.assertIsNotNone(move)
+        board.push(move, 1)
+        self.assertEqual(len(board.get_winning_squares(1)), 1)   # a single threat, answered by force
+        board.pop()
+        saved = alphaBeta.negamax_table, alphaBeta.move_orderer
+        try:
+            alphaBeta.negamax_table = TranspositionTable()
+            alphaBeta.init_move_orderer(board)
+            value, _ = negamax(board, 9, -WIN_SCORE, WIN_SCORE, 1)
+        finally:
+            alphaBeta.negamax_table, alphaBeta.move_orderer = saved
+        self.assertEqual(value, WIN_SCORE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+#!/usr/bin/python3
+
+# AI 531 - m,n,k
+# Wadood Alam
+# Joe Nguyen
+# Matthew Pacey
+
+import unittest
+from collections import namedtuple
+
+from board import Board
+
+import cfg
+
+"""
+Transposition table for the alpha-beta search
+Positions are keyed by the board's canonical (symmetry independent) zobrist hash plus the player to move, so
+transpositions and symmetric positions share one entry. Values are stored from the point of view of the player
+to move and best moves are stored in the canonical frame of the position, so an entry can be reused by any
+search (either side, any symmetric version of the position)
+"""
+
+# bound types
+EXACT = 0   # value is the exact minimax value at the stored depth
+LOWER = 1   # search failed high: true value >= value
+UPPER = 2   # search failed low: true value <= value
+
+# replacement policies when two positions map to the same slot
+REPLACE_ALWAYS = 'always'   # newest entry wins
+REPLACE_DEPTH = 'depth'     # keep the entry searched deeper (ties go to the newest)
+
+# mixed into the key so the same stones with a different player to move get a different entry
+SIDE_KEYS = [0, 0x5bd1e9955bd1e995, 0x9e3779b97f4a7c15]
+
+TTEntry = namedtuple('TTEntry', ['key', 'value', 'flag', 'depth', 'move'])
+
+
+def get_key(board: Board, player):
+    """
+    :param board:
+    :param player: player to move
+    :return: table key of the position
+    """
+    return board.canonical_hash() ^ SIDE_KEYS[player]
+
+
+class TranspositionTable:
+    def __init__(self, size: int = None, policy: str = None):
+        """
+        :param size: number of slots (entries) in the table, caps memory use (default: cfg.tt_size)
+        :param policy: REPLACE_ALWAYS or REPLACE_DEPTH (default: cfg.tt_replacement)
+        """
+        self.size = size if size is not None else cfg.tt_size
+        self.policy = policy if policy is not None else cfg.tt_replacement
+        assert self.policy in [REPLACE_ALWAYS, REPLACE_DEPTH]
+        self.slots = [None] * self.size
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def clear(self):
+        self.slots = [None] * self.size
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def __len__(self):
+        return sum(1 for entry in self.slots if entry is not None)
+
+    def probe(self, key: int):
+        """
+        :param key:
+        :return: TTEntry stored for key, or None
+        """
+        self.probes += 1
+        entry = self.slots[key % self.size]
+        if entry is not None and entry.key == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key: int, value, flag: int, depth: int, move):
+        """
+        Store a search result, subject to the replacement policy
+        :param key:
+        :param value: value for the player to move
+        :param flag: EXACT, LOWER or UPPER
+        :param depth: remaining search depth the value was computed with
+        :param move: best move found (or None)
+        """
+        slot = key % self.size
+        old = self.slots[slot]
+        if self.policy == REPLACE_DEPTH and old is not None and old.key != key and old.depth > depth:
+            return
+        self.slots[slot] = TTEntry(key, value, flag, depth, move)
+        self.stores += 1
+
+    def lookup(self, board: Board, player):
+        """
+        Probe for a board position, with the best move mapped back from the canonical frame onto board
+        :param board:
+        :param player: player to move
+        :return: TTEntry or None
+        """
+        entry = self.probe(get_key(board, player))
+        if entry is not None and entry.move is not None:
+            symmetry = board.get_canonical_symmetry()
+            entry = entry._replace(move=board.geometry.inverse_symmetries[symmetry][entry.move])
+        return entry
+
+    def save(self, board: Board, player, value, flag: int, depth: int, move):
+        """
+        Store a search result for a board position (move is mapped into the canonical frame)
+        :param board:
+        :param player: player to move
+        :param value: value for the player to move
+        :param flag:
+        :param depth:
+        :param move:
+        """
+        if move is not None:
+            move = board.geometry.symmetries[board.get_canonical_symmetry()][move]
+        self.store(get_key(board, player), value, flag, depth, move)
+
+
+class TestTranspositionTable(unittest.TestCase):
+    def test_store_probe(self):
+        table = TranspositionTable(16, REPLACE_DEPTH)
+        table.store(5, 1, EXACT, 3, 7)
+        self.assertEqual(table.probe(5), TTEntry(5, 1, EXACT, 3, 7))
+        self.assertIsNone(table.probe(21))  # same slot, different key
+
+        # depth preferred: a shallower result for another key does not evict the deeper one
+        table.store(21, 0, LOWER, 2, 1)
+        self.assertIsNotNone(table.probe(5))
+        table.store(21, 0, LOWER, 4, 1)
+        self.assertIsNone(table.probe(5))
+        self.assertEqual(table.probe(21).depth, 4)
+        self.assertEqual((table.probes, table.hits), (5, 3))
+
+        table = TranspositionTable(16, REPLACE_ALWAYS)
+        table.store(5, 1, EXACT, 3, 7)
+        table.store(21, 0, LOWER, 2, 1)
+        self.assertIsNone(table.probe(5))
+        self.assertEqual(len(table), 1)
+
+    def test_symmetric_positions(self):
+        """
+        A symmetric position finds the entry, with the best move mapped onto its own frame
+        """
+        table = TranspositionTable(1024)
+        board = Board((3, 3), 3)
+        board.make_move(0, 1)
+        table.save(board, 2, -1, EXACT, 5, 4)
+        table.save(board, 1, 1, UPPER, 5, 1)      # other player to move is a separate entry
+
+        mirrored = Board((3, 3), 3)
+        mirrored.make_move(2, 1)                  # corner X mirrored left/right
+        entry = table.lookup(mirrored, 2)
+        self.assertEqual((entry.value, entry.flag, entry.move), (-1, EXACT, 4))
+        entry = table.lookup(mirrored, 1)
+        self.assertEqual((entry.value, entry.flag), (1, UPPER))
+        self.assertIn(entry.move, [1, 5])         # edge next to the corner (both are symmetric here)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,6 +5,18 @@ def log(msg: str):
     if cfg.DEBUG:
         print(msg)
 
+def get_candidate_squares(board):
+    """
+    Empty squares the search engines consider: on large boards only those within cfg.candidate_radius of a
+    stone (see Board.get_nearby_squares), else all of them
+    :param board:
+    :return: list of squares (sorted on large boards, in no particular order otherwise)
+    """
+    if cfg.candidate_radius is None or board.size[0] * board.size[1] < cfg.candidate_min_cells:
+        return list(board.iter_empty_squares())
+    return board.get_nearby_squares(cfg.candidate_radius)
+
+
 def get_other_player(player):
     """
     Get the alternate player (used to switch between for moves)